@@ -1,11 +1,10 @@
 # standard_generator.py
 # Authors: Stephan Meighen-Berger
 # Script to generate the standard used
+# This is equivalent to running
+#   python -m fledgeling build --set "general.enable logging=true"
 
-# sloth
-import sys
-sys.path.append("../")
-from fledgeling import Fledgeling, config
+from fledgeling.__main__ import main as cli
 
 
 def main():
@@ -14,12 +13,7 @@ def main():
     print("Welcome to fledgeling!")
     print("I'll be generating the standard tables.")
     print("This may take a while")
-    config["general"]["enable logging"] = True
-    config["experimental data"]["pre-computed"] = False
-    config["advanced"]["store conversion tables"] = True
-
-    fledge = Fledgeling()
-    fledge.close()
+    cli(["build", "--set", "general.enable logging=true"])
 
 if __name__ == "__main__":
     main()
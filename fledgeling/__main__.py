@@ -1,18 +1,220 @@
 # -*- coding: utf-8 -*-
 # __main__.py
 # Authors: Stephan Meighen-Berger
+# Command line interface of fledgeling
 
-def main():
-    """ Tells the user how to use fledgeling
+import argparse
+import os
+import signal
+import sys
+import time
+import numpy as np
+import yaml
+from .config import config
+
+
+def _override(setting: str) -> None:
+    """ Applies a single config override of the form "section.key=value".
+    The value is parsed as yaml
+
+    Parameters
+    ----------
+    setting: str
+        The override
+
+    Returns
+    -------
+    None
+    """
+    path, value = setting.split("=", 1)
+    keys = path.split(".")
+    tmp = config
+    for key in keys[:-1]:
+        tmp = tmp[key]
+    tmp[keys[-1]] = yaml.safe_load(value)
+
+
+def _setup_config(args: argparse.Namespace) -> None:
+    """ Applies the config file and overrides from the command line
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        The parsed arguments
+
+    Returns
+    -------
+    None
+    """
+    if args.config is not None:
+        config.from_yaml(args.config)
+    for setting in args.set:
+        _override(setting)
+    if args.jobs is not None:
+        config["advanced"]["jobs"] = args.jobs
+
+
+def _build(args: argparse.Namespace) -> None:
+    """ Builds the conversion and/or atmospheric tables
+    """
+    from .fledgeling import Fledgeling
+    if args.output is not None:
+        config["advanced"]["conversion dump"] = os.path.join(args.output, "")
+    if "conversion" in args.tables:
+        config["experimental data"]["pre-computed"] = False
+        config["advanced"]["store conversion tables"] = True
+        os.makedirs(os.path.dirname(
+            config["advanced"]["conversion dump"] + config["experimental data"]["tables"]
+        ), exist_ok=True)
+    if "atmospherics" in args.tables:
+        config["atmospherics"]["pre-computed"] = False
+        os.makedirs(os.path.dirname(
+            config["advanced"]["conversion dump"] +
+            config["atmospherics"]["mceq model"]["atmospheric storage"]
+        ), exist_ok=True)
+    fledge = Fledgeling()
+    fledge.close()
+
+
+def _fold(args: argparse.Namespace) -> None:
+    """ Folds flux files into expected counts. Each flux file contains two columns,
+    the energy in GeV and the differential flux in 1/(GeV cm^2 s sr).
+    The flux is interpolated in log-log onto the energy grid
+    """
+    from .fledgeling import Fledgeling
+    fledge = Fledgeling()
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+    for flux_file in args.flux:
+        energies, flux = np.loadtxt(flux_file, unpack=True)
+        flux_grid = 10**np.interp(
+            np.log10(fledge.egrid), np.log10(energies), np.log10(flux),
+            left=-np.inf, right=-np.inf
+        )
+        counts = fledge.fold(flux_grid, years=args.years, theta_range=args.thetas)
+        name = os.path.splitext(os.path.basename(flux_file))[0] + "_counts.npz"
+        out_file = os.path.join(
+            args.output if args.output is not None else os.path.dirname(flux_file),
+            name
+        )
+        np.savez(
+            out_file,
+            total=np.sum(list(counts.values()), axis=0),
+            **{"year_%d" % year: counts[year] for year in counts.keys()}
+        )
+        print("Stored the expected counts of %s in %s" % (flux_file, out_file))
+    fledge.close()
+
+
+def _serve(args: argparse.Namespace) -> None:
+    """ Loads the tables once and publishes them in shared memory until stopped.
+    Workers attach using --set "advanced.shared tables=<manifest>"
+    """
+    from .fledgeling import Fledgeling
+    from .shared import TableServer
+    fledge = Fledgeling()
+    # Stopping cleanly on SIGTERM as well, so the block is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with TableServer(fledge, args.manifest):
+        print("Serving the tables with manifest %s. Stop with Ctrl+C" % args.manifest)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    fledge.close()
+
+
+def _benchmark(args: argparse.Namespace) -> None:
+    """ Runs the built-in benchmarks and prints the timings
+    """
+    from .benchmarks import run_benchmarks
+    results = run_benchmarks(repeats=args.repeats)
+    for name, timing in results.items():
+        print("%-20s best: %10.4f s  mean: %10.4f s" % (
+            name, timing["best"], timing["mean"]
+        ))
+
+
+def main(argv=None):
+    """ Command line entry point of fledgeling
+
+    Parameters
+    ----------
+    argv: list
+        The arguments. Defaults to the command line
+
+    Returns
+    -------
+    None
     """
-    print("Welcome to fledgeling!")
-    print("Please note fledgeling is a package and cannot be directly executed")
-    print("The current fledgeling version is 0.0.1")
-    print("Usage after installation:")
-    print("from fledgeling import Fledgeling")
-    print("fledgeling_obj = Fledgeling()")
-    print("Visit the following link for examples:")
-    print("https://github.com/MeighenBergerS/fledgeling/tree/master/notebooks")
+    parser = argparse.ArgumentParser(
+        prog="fledgeling",
+        description="Builds tables, folds fluxes, serves tables and runs benchmarks for fledgeling"
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--config", default=None,
+        help="yaml file used to update the config"
+    )
+    common.add_argument(
+        "--set", action="append", default=[], metavar="SECTION.KEY=VALUE",
+        help="Override a config value, e.g. --set 'experimental data.filepath=/data'"
+    )
+    common.add_argument(
+        "--jobs", type=int, default=None,
+        help="Number of worker processes. Defaults to the config's"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser(
+        "build", parents=[common], help="Build the conversion and atmospheric tables"
+    )
+    build.add_argument(
+        "--tables", nargs="+", choices=["conversion", "atmospherics"],
+        default=["conversion", "atmospherics"],
+        help="The tables to build. Others are loaded"
+    )
+    build.add_argument(
+        "--output", default=None,
+        help="Folder to store the tables in. Defaults to the config's conversion dump"
+    )
+    build.set_defaults(func=_build)
+    fold = subparsers.add_parser(
+        "fold", parents=[common], help="Fold flux files into expected counts"
+    )
+    fold.add_argument("flux", nargs="+", help="The flux files")
+    fold.add_argument(
+        "--years", type=int, nargs="+", default=None,
+        help="The years to fold for. Defaults to all"
+    )
+    fold.add_argument(
+        "--thetas", type=float, nargs=2, default=None, metavar=("MIN", "MAX"),
+        help="Range of the injected theta angles in degrees. Defaults to all"
+    )
+    fold.add_argument(
+        "--output", default=None,
+        help="Folder to store the counts in. Defaults to the flux file's folder"
+    )
+    fold.set_defaults(func=_fold)
+    serve = subparsers.add_parser(
+        "serve", parents=[common], help="Publish the tables in shared memory for workers"
+    )
+    serve.add_argument(
+        "--manifest", default="/dev/shm/fledgeling.json",
+        help="Location of the manifest the workers attach with"
+    )
+    serve.set_defaults(func=_serve)
+    benchmark = subparsers.add_parser(
+        "benchmark", parents=[common], help="Run the built-in benchmarks"
+    )
+    benchmark.add_argument(
+        "--repeats", type=int, default=5,
+        help="Number of repetitions of each benchmark"
+    )
+    benchmark.set_defaults(func=_benchmark)
+    args = parser.parse_args(argv)
+    _setup_config(args)
+    args.func(args)
 
 
 if __name__ == "__main__":
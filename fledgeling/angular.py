@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# Name: angular.py
+# Authors: Stephan Meighen-Berger
+# Conversion tables keeping the PSF and angular error dimensions
+
+import logging
+import os
+import zipfile
+import numpy as np
+
+
+_log = logging.getLogger(__name__)
+# The axes of the angular tables after the reconstructed energy
+_AXES = ("psf", "angerr")
+
+
+def build_angular_tables(
+        dr,
+        e_grid: np.array,
+        thetas: np.array,
+        years: list,
+        psf_bins: np.array,
+        angerr_bins: np.array,
+        path: str) -> None:
+    """ Builds the angular tables and stores them on disk. The full tables are
+    the conversion tables times the angular distributions of the smearing matrix
+    cell of each theta and energy. Only the distributions and cells are stored,
+    with one compressed chunk per year and quantity
+
+    Parameters
+    ----------
+    dr: DR
+        The data reader
+    e_grid: np.array
+        The energy grid in GeV
+    thetas: np.array
+        The theta grid in degrees
+    years: list
+        The years to build for
+    psf_bins: np.array
+        The PSF bin edges in degrees
+    angerr_bins: np.array
+        The angular error bin edges in degrees
+    path: str
+        The file to store the tables in
+
+    Returns
+    -------
+    None
+    """
+    unigrid = np.log10(e_grid)
+    tmp_file = path + ".tmp"
+    with zipfile.ZipFile(tmp_file, "w", compression=zipfile.ZIP_DEFLATED) as store:
+        for name, arr in [("psf bins", psf_bins), ("angerr bins", angerr_bins)]:
+            with store.open(name + ".npy", "w") as f:
+                np.lib.format.write_array(f, np.asarray(arr))
+        for year in years:
+            _log.info("Building the angular tables for year %d" % year)
+            cells, fractions = dr.angular_fractions(
+                e_grid, thetas, year, unigrid, psf_bins, angerr_bins
+            )
+            for name, arr in [("cells", cells), ("fractions", fractions)]:
+                with store.open("%s_%d.npy" % (name, year), "w") as f:
+                    np.lib.format.write_array(f, arr)
+    # An interrupted build never leaves a partial file behind
+    os.replace(tmp_file, path)
+
+
+class AngularTables(object):
+    """ Conversion tables with the additional PSF and angular error dimensions.
+    The shape of a full table is (len(thetas), len(egrid), len(egrid), PSF bins,
+    angular error bins). They are never stored in full. Instead the chunks of
+    each year are read lazily and the unneeded axes are marginalized on the fly
+
+    Parameters
+    ----------
+    path: str
+        The file created by build_angular_tables
+    conversion_tables: dict
+        The (standard) conversion tables of each year
+    """
+    def __init__(self, path: str, conversion_tables: dict):
+        self._store = np.load(path)
+        self._conversion_tables = conversion_tables
+        self._psf_bins = self._store["psf bins"]
+        self._angerr_bins = self._store["angerr bins"]
+        self._chunks = {}
+
+    @property
+    def psf_bins(self):
+        """ The PSF bin edges in degrees
+        """
+        return self._psf_bins
+
+    @property
+    def angerr_bins(self):
+        """ The angular error bin edges in degrees
+        """
+        return self._angerr_bins
+
+    def _chunk(self, year: int) -> tuple:
+        """ Loads (and caches) the cells and angular distributions of a year
+        """
+        if year not in self._chunks:
+            self._chunks[year] = (
+                self._store["cells_%d" % year], self._store["fractions_%d" % year]
+            )
+        return self._chunks[year]
+
+    def _marginal(self, year: int, keep: tuple) -> tuple:
+        """ The cells and angular distributions summed over the axes not kept
+        """
+        for axis in keep:
+            if axis not in _AXES:
+                raise ValueError("Unknown angular axis %s! Use psf or angerr" % axis)
+        cells, fractions = self._chunk(year)
+        summed = tuple(2 + i for i, axis in enumerate(_AXES) if axis not in keep)
+        return cells, np.sum(fractions, axis=summed)
+
+    def table(self, year: int, theta_mask=None, keep=_AXES) -> np.array:
+        """ The (marginalized) angular conversion table of a year
+
+        Parameters
+        ----------
+        year: int
+            The year of interest
+        theta_mask: np.array
+            Boolean mask of the thetas to return. Defaults to all.
+            Restrict this when keeping both angular axes, the full table is large
+        keep: tuple
+            The angular axes to keep, any of "psf" and "angerr"
+
+        Returns
+        -------
+        table: np.array
+            The table with shape (thetas, len(egrid), len(egrid), kept axes...)
+        """
+        cells, fractions = self._marginal(year, keep)
+        tables = self._conversion_tables[year]
+        if theta_mask is not None:
+            cells = cells[theta_mask]
+            tables = tables[theta_mask]
+        extra = (np.newaxis,) * len(keep)
+        # Energies and angles outside of the smearing matrix are zero
+        values = np.where(
+            (cells >= 0)[(...,) + (np.newaxis,) * (1 + len(keep))],
+            fractions[np.maximum(cells, 0)], 0.
+        )
+        return tables[(...,) + extra] * values
+
+    def fold(
+            self,
+            weights: np.array,
+            year: int,
+            theta_mask: np.array,
+            keep=_AXES) -> np.array:
+        """ Folds flux weights with the angular tables without building them.
+        The weights of all thetas and energies sharing a smearing matrix cell
+        are combined first
+
+        Parameters
+        ----------
+        weights: np.array
+            The flux integrated over the energy bins times the integration weights of
+            the thetas, with shape (number of selected thetas, len(egrid))
+        year: int
+            The year of interest
+        theta_mask: np.array
+            Boolean mask of the thetas to use
+        keep: tuple
+            The angular axes to keep, any of "psf" and "angerr"
+
+        Returns
+        -------
+        rates: np.array
+            The rates with shape (len(egrid), kept axes...)
+        """
+        cells, fractions = self._marginal(year, keep)
+        cells = cells[theta_mask]
+        weighted = weights[..., None] * self._conversion_tables[year][theta_mask]
+        valid = cells >= 0
+        per_cell = np.zeros((len(fractions),) + weighted.shape[-1:])
+        np.add.at(per_cell, cells[valid], weighted[valid])
+        return np.einsum("cu,cu...->u...", per_cell, fractions)
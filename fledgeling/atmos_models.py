@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Name: atmos_models.py
+# Authors: Stephan Meighen-Berger
+# Fast tabulated and analytic atmospheric neutrino fluxes
+
+import logging
+import re
+from functools import lru_cache
+import numpy as np
+
+
+_log = logging.getLogger(__name__)
+# Columns of the HKKM tables after the energy
+_HKKM_COLUMNS = ["numu", "antinumu", "nue", "antinue"]
+# Parameters of the effective zenith angle in a curved atmosphere (Chirkin 2004)
+_COS_PARAMS = (0.102573, -0.068287, 0.958633, 0.0407253, 0.817285)
+
+
+@lru_cache(maxsize=None)
+def read_hkkm(path: str) -> tuple:
+    """ Reads a tabulated HKKM (Honda et al.) flux file. The file consists of
+    blocks starting with a line containing "cosZ = <min> -- <max>", followed by
+    a column header and rows of energy, numu, antinumu, nue and antinue fluxes.
+    The results are cached and read-only
+
+    Parameters
+    ----------
+    path: str
+        The table file
+
+    Returns
+    -------
+    cos_zenith: np.array
+        The (ascending) centers of the cos(zenith) bins
+    energies: np.array
+        The energies in GeV
+    fluxes: dict
+        The fluxes in 1/(GeV cm^2 s sr) for each column with shape
+        (len(cos_zenith), len(energies))
+
+    Raises
+    ------
+    ValueError
+        The blocks use different energies
+    """
+    cos_zenith = []
+    blocks = []
+    with open(path) as f:
+        for line in f:
+            match = re.search(r"cosZ\s*=\s*([-+.\deE]+)\s*--\s*([-+.\deE]+)", line)
+            if match is not None:
+                cos_zenith.append((float(match.group(1)) + float(match.group(2))) / 2.)
+                blocks.append([])
+                continue
+            values = line.split()
+            if blocks and len(values) == 5:
+                try:
+                    blocks[-1].append([float(value) for value in values])
+                except ValueError:
+                    # The column header
+                    pass
+    blocks = [np.array(block) for block in blocks]
+    for block in blocks[1:]:
+        if block.shape != blocks[0].shape or not np.allclose(block[:, 0], blocks[0][:, 0]):
+            raise ValueError("The HKKM table blocks use different energies!")
+    order = np.argsort(cos_zenith)
+    cos_zenith = np.array(cos_zenith)[order]
+    energies = blocks[0][:, 0]
+    # From 1/(GeV m^2 s sr)
+    table = np.array(blocks)[order, :, 1:] / 1e4
+    fluxes = {column: table[..., i] for i, column in enumerate(_HKKM_COLUMNS)}
+    for arr in [cos_zenith, energies] + list(fluxes.values()):
+        arr.setflags(write=False)
+    return cos_zenith, energies, fluxes
+
+
+def interpolate_table(
+        cos_grid: np.array,
+        e_grid: np.array,
+        flux: np.array,
+        energies: np.array,
+        cos_zenith: np.array) -> np.array:
+    """ Interpolates a tabulated flux in log10(flux) bilinearly in log10(E) and
+    cos(zenith). Beyond the energies of the table the flux is extrapolated as a
+    power law, beyond the cos(zenith) range the closest bin is used
+
+    Parameters
+    ----------
+    cos_grid: np.array
+        The (ascending) cos(zenith) of the table
+    e_grid: np.array
+        The (ascending) energies of the table in GeV
+    flux: np.array
+        The tabulated flux with shape (len(cos_grid), len(e_grid))
+    energies: np.array
+        The energies to evaluate at in GeV
+    cos_zenith: np.array
+        The cos(zenith) to evaluate at
+
+    Returns
+    -------
+    flux: np.array
+        The interpolated flux with shape (len(cos_zenith), len(energies))
+    """
+    log_flux = np.log10(flux)
+    log_e = np.log10(e_grid)
+    e_idx = np.clip(np.searchsorted(log_e, np.log10(energies)) - 1, 0, len(log_e) - 2)
+    e_frac = (np.log10(energies) - log_e[e_idx]) / (log_e[e_idx + 1] - log_e[e_idx])
+    cos_zenith = np.clip(np.atleast_1d(cos_zenith), cos_grid[0], cos_grid[-1])
+    if len(cos_grid) > 1:
+        c_idx = np.clip(np.searchsorted(cos_grid, cos_zenith) - 1, 0, len(cos_grid) - 2)
+        c_frac = (cos_zenith - cos_grid[c_idx]) / (cos_grid[c_idx + 1] - cos_grid[c_idx])
+    else:
+        c_idx = np.zeros(len(cos_zenith), dtype=int)
+        c_frac = np.zeros(len(cos_zenith))
+    c_next = np.minimum(c_idx + 1, len(cos_grid) - 1)
+    def along_e(rows):
+        return (
+            (1. - e_frac) * rows[:, e_idx] + e_frac * rows[:, e_idx + 1]
+        )
+    low = along_e(log_flux[c_idx])
+    high = along_e(log_flux[c_next])
+    return 10**((1. - c_frac)[:, None] * low + c_frac[:, None] * high)
+
+
+def effective_cos(cos_zenith: np.array) -> np.array:
+    """ The effective cos(zenith) in the curved atmosphere (Chirkin 2004)
+
+    Parameters
+    ----------
+    cos_zenith: np.array
+        The cos(zenith) at the detector
+
+    Returns
+    -------
+    cos_eff: np.array
+        The effective cos(zenith)
+    """
+    p1, p2, p3, p4, p5 = _COS_PARAMS
+    cos_zenith = np.clip(cos_zenith, 0., 1.)
+    return np.sqrt(
+        (cos_zenith**2 + p1**2 + p2 * cos_zenith**p3 + p4 * cos_zenith**p5) /
+        (1. + p1**2 + p2 + p4)
+    )
+
+
+def conventional_flux(energies: np.array, cos_zenith: np.array, params: dict) -> np.array:
+    """ Closed-form approximation of the conventional atmospheric neutrino flux
+    from pion and kaon decays (Gaisser, Engel & Resconi 2016, chapter 6).
+    Muon decays are neglected, so it is only valid above roughly 100 GeV
+
+    Parameters
+    ----------
+    energies: np.array
+        The energies in GeV
+    cos_zenith: np.array
+        The cos(zenith) at the detector
+    params: dic
+        The primary normalization and index, the spectrum weighted moments
+        and critical energies. See the "analytic model" of the config
+
+    Returns
+    -------
+    flux: np.array
+        The flux in 1/(GeV cm^2 s sr) with shape (len(cos_zenith), len(energies))
+    """
+    energies = np.asarray(energies, dtype=float)
+    cos_eff = effective_cos(np.atleast_1d(cos_zenith))[:, None]
+    primary = params["norm"] * energies**-params["index"] / (1. - params["Z_NN"])
+    pion = params["A_pi"] / (1. + params["B_pi"] * cos_eff * energies / params["epsilon_pi"])
+    kaon = params["A_K"] / (1. + params["B_K"] * cos_eff * energies / params["epsilon_K"])
+    return primary * (pion + kaon)
+
+
+def cascade_from_fluxes(ebins: np.array, zeniths: list, numu: np.array, nue: np.array) -> dict:
+    """ Packs fluxes evaluated at the energy bin centers into the structure of
+    the simulation results
+
+    Parameters
+    ----------
+    ebins: np.array
+        The energy bin edges in GeV
+    zeniths: list
+        The zeniths in degrees
+    numu: np.array
+        The numu + antinumu fluxes with shape (len(zeniths), len(ebins) - 1)
+    nue: np.array
+        The nue + antinue fluxes with shape (len(zeniths), len(ebins) - 1)
+
+    Returns
+    -------
+    cascade: dict
+        The "e grid", "e width", "e bin", "numu" and "nue" of each zenith
+    """
+    return {
+        zen: {
+            "e grid": np.sqrt(ebins[1:] * ebins[:-1]),
+            "e width": ebins[1:] - ebins[:-1],
+            "e bin": np.array(ebins),
+            "numu": numu[i],
+            "nue": nue[i],
+        }
+        for i, zen in enumerate(zeniths)
+    }
@@ -4,11 +4,21 @@
 # Builds the high-energy atmospheric flux tables
 
 import logging
-from MCEq.core import MCEqRun
-import crflux.models as pm
-import pkgutil
 import pickle as pkl
-from .config import config
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from .shared import attach
+from .utils import read_stored
+from .atmos_models import (
+    read_hkkm, interpolate_table, conventional_flux, cascade_from_fluxes
+)
+# MCEq is only needed to generate new tables with the mceq approach
+try:
+    from MCEq.core import MCEqRun
+    import crflux.models as pm
+except ImportError:
+    MCEqRun = None
+    pm = None
 
 
 _log = logging.getLogger(__name__)
@@ -20,32 +30,56 @@ class Atmos(object):
 
     Parameters
     ----------
-    None
+    ebins: np.array
+        The energy bin edges the fluxes are projected onto. Should have units GeV
+    thetas: np.array
+        The thetas the fluxes are projected onto
+    config: dic
+        The configuration (snapshot) to use
+    month: str
+        Use the atmosphere of this month instead of the configured one.
+        The tables are stored separately for each month
 
     Raises
     ------
     Unknown atmospheric model
     """
-    def __init__(self):
-        if not config["general"]["enable logging"]:
-            _log.disabled = True
-        if config["atmospherics"]["name"] == "mceq":
+    def __init__(self, ebins: np.array, thetas: np.array, config: dict, month=None):
+        self._config = config
+        self._projections = {}
+        if config["advanced"]["shared tables"] is not None and month is None:
+            _log.info("Attaching to the shared atmospheric tables")
+            self._cascade = dict(attach(config["advanced"]["shared tables"])["cascade"])
+        elif config["atmospherics"]["name"] == "mceq":
             self._mceq_setup = config["atmospherics"]["mceq model"]
-            try:
+            if month is None:
                 self._load_str = (
                         self._mceq_setup["atmospheric storage"]
                     )
-                _log.info("Trying to load pre-calculated tables")
-                _log.debug("Searching for " + self._load_str)
-                _log.info("Loading pre-computed data")
-                param_file = pkgutil.get_data(
-                        __name__,
-                        self._load_str
-                )
-                self._cascade = pkl.loads(param_file)
-            except FileNotFoundError:
-                _log.warning('Shower file not found')
+            else:
+                self._load_str = (
+                        self._mceq_setup["seasonal storage"] % month
+                    )
+            self._cascade = None
+            if config["atmospherics"]["pre-computed"]:
+                try:
+                    _log.info("Trying to load pre-calculated tables")
+                    _log.debug("Searching for " + self._load_str)
+                    _log.info("Loading pre-computed data")
+                    param_file = read_stored(
+                            self._load_str,
+                            config["advanced"]["conversion dump"]
+                    )
+                    self._cascade = pkl.loads(param_file)
+                except FileNotFoundError:
+                    _log.warning('Shower file not found')
+            if self._cascade is None:
                 _log.info("Generating new atmospherics tables")
+                if MCEqRun is None:
+                    raise ImportError(
+                        "MCEq is required to generate the atmospheric tables! " +
+                        "Install it or use the hkkm or analytic approach"
+                    )
                 # MCEq setup
                 _log.info("Setting up MCEq")
                 # Setting up MCEq
@@ -56,6 +90,10 @@ class Atmos(object):
                     "Using the " + self._primary_model[0] +
                     "model with subset " + self._primary_model[1])
                 self._atmosphere = self._mceq_setup["atmosphere"]
+                if month is not None:
+                    self._atmosphere = (
+                        self._atmosphere[0], (self._atmosphere[1][0], month)
+                    )
                 _log.debug(
                     "Using the " + self._atmosphere[0] +
                     "model at " + self._atmosphere[1][0] +
@@ -68,26 +106,30 @@ class Atmos(object):
                     raise ValueError("Unknown primary model!")
                 self._zeniths = self._mceq_setup["zeniths"]
                 _log.info("Starting zenith loop")
-                self._cascade = {}
-                for zen in self._zeniths:
-                    _log.debug("Using zenith set to %.f" % zen)
-                    self._mceq_run = MCEqRun(
-                        interaction_model=self._int_model,
-                        primary_model=(self.__pm, self._primary_model[1]),
-                        theta_deg=zen
-                    )
-                    # Setting the atmosphere
-                    self._mceq_run.set_density_model(self._atmosphere)
-                    # Running the simulation
-                    _log.info("Running the simulation")
-                    self._cascade[zen] = self._run()
+                jobs = config["advanced"]["jobs"]
+                if jobs > 1:
+                    _log.info("Running the zeniths on %d processes" % jobs)
+                    with ProcessPoolExecutor(max_workers=jobs) as executor:
+                        self._cascade = dict(zip(
+                            self._zeniths, executor.map(self._run, self._zeniths)
+                        ))
+                else:
+                    self._cascade = {}
+                    for zen in self._zeniths:
+                        self._cascade[zen] = self._run(zen)
                 _log.debug("Dumping results for later use")
-                pkl.dump(
-                    self._cascade,
-                    open("%s" % self._load_str, "wb")
-                )
+                with open(config["advanced"]["conversion dump"] + self._load_str, "wb") as f:
+                    pkl.dump(self._cascade, f)
+        elif config["atmospherics"]["name"] == "hkkm":
+            _log.info("Interpolating the tabulated HKKM fluxes")
+            self._cascade = self._hkkm(ebins, month)
+        elif config["atmospherics"]["name"] == "analytic":
+            _log.info("Evaluating the analytic conventional fluxes")
+            self._cascade = self._analytic(ebins)
         else:
             raise ValueError("Unknown atmospherics simulation approach! Please check the config file")
+        _log.info("Projecting the fluxes onto the energy and theta grids")
+        self._binned = self.project(ebins, thetas)
 
     @property
     def cascade(self):
@@ -95,35 +137,200 @@ class Atmos(object):
         """
         return self._cascade
 
-    def _run(self):
-        """ Runs the atmospheric shower simulation
+    @property
+    def binned(self):
+        """ The fluxes integrated over each energy bin for each theta in 1/(cm^2 s sr).
+        Dictionary with the flavors as keys and arrays of shape (len(thetas), len(ebins) - 1)
+        """
+        return self._binned
+
+    def projection(self, ebins: np.array) -> np.array:
+        """ Bin-overlap operator from the simulation energy bins to other energy bins.
+        The fluxes are treated as constant within each simulation bin.
+        The operators are cached
+
+        Parameters
+        ----------
+        ebins: np.array
+            The energy bin edges to project onto in GeV
+
+        Returns
+        -------
+        projection: np.array
+            The overlap (in GeV) of each new bin with each simulation bin with
+            shape (len(ebins) - 1, number of simulation bins). Multiplying it with
+            a flux gives the flux integrated over the new bins
+        """
+        key = tuple(ebins)
+        if key not in self._projections:
+            sim_bins = self._sim_bins()
+            low = np.maximum(ebins[:-1, None], sim_bins[None, :-1])
+            high = np.minimum(ebins[1:, None], sim_bins[None, 1:])
+            self._projections[key] = np.clip(high - low, 0., None)
+        return self._projections[key]
+
+    def _sim_bins(self) -> np.array:
+        """ The energy bin edges of the simulation. These are the same for all zeniths
 
         Parameters
         ----------
         None
 
+        Returns
+        -------
+        sim_bins: np.array
+            The bin edges in GeV
+
+        Raises
+        ------
+        ValueError
+            The zeniths use different energy grids
+        """
+        bins = [np.asarray(self._cascade[zen]["e bin"]) for zen in self._cascade.keys()]
+        for zen_bins in bins[1:]:
+            if zen_bins.shape != bins[0].shape or not np.allclose(zen_bins, bins[0]):
+                raise ValueError("The atmospheric zeniths use different energy grids!")
+        return bins[0]
+
+    def project(self, ebins: np.array, thetas: np.array) -> dict:
+        """ Projects the fluxes onto energy bins and thetas in one pass for all
+        zeniths and flavors. Up-going thetas (> 90) use the flux produced at
+        180 - theta. Between the simulated zeniths the fluxes are linearly
+        interpolated, beyond them the closest one is used
+
+        Parameters
+        ----------
+        ebins: np.array
+            The energy bin edges in GeV
+        thetas: np.array
+            The thetas in degrees
+
+        Returns
+        -------
+        binned: dict
+            The fluxes integrated over each energy bin in 1/(cm^2 s sr) for each
+            flavor. The arrays have the shape (len(thetas), len(ebins) - 1)
+        """
+        flavors = ["numu", "nue"]
+        zeniths = np.array(sorted(self._cascade.keys()), dtype=float)
+        fluxes = np.array([
+            [self._cascade[zen][flavor] for flavor in flavors] for zen in sorted(self._cascade.keys())
+        ])
+        # Interpolation weights of the zeniths for each theta
+        production = np.where(thetas <= 90., thetas, 180. - thetas)
+        identity = np.eye(len(zeniths))
+        theta_weights = np.array([
+            np.interp(production, zeniths, identity[i]) for i in range(len(zeniths))
+        ]).T
+        binned = np.einsum(
+            "tz,zfn,en->fte", theta_weights, fluxes, self.projection(ebins)
+        )
+        return {flavor: binned[i] for i, flavor in enumerate(flavors)}
+
+    def _hkkm(self, ebins: np.array, month=None) -> dict:
+        """ Interpolates the HKKM tables onto the energy bins and zeniths
+
+        Parameters
+        ----------
+        ebins: np.array
+            The energy bin edges in GeV
+        month: str
+            Use the table of this month
+
+        Returns
+        -------
+        cascade: dict
+            The fluxes of each zenith in the structure of _run
+
+        Raises
+        ------
+        ValueError
+            No table set
+        """
+        setup = self._config["atmospherics"]["hkkm model"]
+        if month is not None and setup["seasonal table"] is not None:
+            table_file = setup["seasonal table"] % month
+        else:
+            table_file = setup["table"]
+        if table_file is None:
+            raise ValueError("No HKKM table set! Please check the config file")
+        cos_grid, e_grid, fluxes = read_hkkm(table_file)
+        zeniths = list(setup["zeniths"])
+        cos_zenith = np.cos(np.radians(zeniths))
+        egrid = np.sqrt(ebins[1:] * ebins[:-1])
+        summed = {
+            flavor: sum(
+                interpolate_table(cos_grid, e_grid, fluxes[column], egrid, cos_zenith)
+                for column in [flavor, "anti" + flavor]
+            )
+            for flavor in ["numu", "nue"]
+        }
+        return cascade_from_fluxes(ebins, zeniths, summed["numu"], summed["nue"])
+
+    def _analytic(self, ebins: np.array) -> dict:
+        """ Evaluates the analytic conventional fluxes on the energy bins and zeniths
+
+        Parameters
+        ----------
+        ebins: np.array
+            The energy bin edges in GeV
+
+        Returns
+        -------
+        cascade: dict
+            The fluxes of each zenith in the structure of _run
+        """
+        setup = self._config["atmospherics"]["analytic model"]
+        zeniths = list(setup["zeniths"])
+        cos_zenith = np.cos(np.radians(zeniths))
+        egrid = np.sqrt(ebins[1:] * ebins[:-1])
+        primary = {key: setup[key] for key in ["norm", "index", "Z_NN"]}
+        fluxes = {
+            flavor: conventional_flux(egrid, cos_zenith, dict(primary, **setup[flavor]))
+            for flavor in ["numu", "nue"]
+        }
+        return cascade_from_fluxes(ebins, zeniths, fluxes["numu"], fluxes["nue"])
+
+    def _run(self, zen: float):
+        """ Runs the atmospheric shower simulation
+
+        Parameters
+        ----------
+        zen: float
+            The zenith angle in degrees
+
         Returns
         -------
         dict:
             Dictionary containing the energy grid(s)
             and the nue and numu fluxes.
         """
-        self._mceq_run.solve()
+        _log.debug("Using zenith set to %.f" % zen)
+        mceq_run = MCEqRun(
+            interaction_model=self._int_model,
+            primary_model=(self.__pm, self._primary_model[1]),
+            theta_deg=zen
+        )
+        # Setting the atmosphere
+        mceq_run.set_density_model(self._atmosphere)
+        # Running the simulation
+        _log.info("Running the simulation")
+        mceq_run.solve()
         # Fetching nu_mu
         mceq_numu_flux = (
-            self._mceq_run.get_solution('total_numu', 0) +
-            self._mceq_run.get_solution('total_antinumu', 0)
+            mceq_run.get_solution('total_numu', 0) +
+            mceq_run.get_solution('total_antinumu', 0)
         )
         # Fetching nu_e
         mceq_nue_flux = (
-            self._mceq_run.get_solution('total_nue', 0) +
-            self._mceq_run.get_solution('total_antinue', 0)
+            mceq_run.get_solution('total_nue', 0) +
+            mceq_run.get_solution('total_antinue', 0)
         )
 
         return {
-            "e grid": self._mceq_run.e_grid,
-            "e width": self._mceq_run.e_widths,
-            "e bin": self._mceq_run.e_bins,
+            "e grid": mceq_run.e_grid,
+            "e width": mceq_run.e_widths,
+            "e bin": mceq_run.e_bins,
             "numu": mceq_numu_flux,
             "nue": mceq_nue_flux,
         }
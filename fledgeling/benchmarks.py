@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Name: benchmarks.py
+# Authors: Stephan Meighen-Berger
+# Built-in timing benchmarks of the most used code paths
+
+import logging
+import time
+from typing import Callable, Dict
+import numpy as np
+
+
+_log = logging.getLogger(__name__)
+
+
+def time_func(func: Callable, repeats: int) -> Dict[str, float]:
+    """ Times a function
+
+    Parameters
+    ----------
+    func: Callable
+        The function to time. It is called without arguments
+    repeats: int
+        Number of times the function is called
+
+    Returns
+    -------
+    timing: Dict
+        The best and mean time per call in seconds
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"best": np.min(times), "mean": np.mean(times)}
+
+
+def run_benchmarks(repeats=5, userconfig=None) -> Dict[str, Dict[str, float]]:
+    """ Runs the built-in benchmarks
+
+    Parameters
+    ----------
+    repeats: int
+        Number of repetitions of each benchmark. The setup is only timed once
+    userconfig: dic
+        Optional configuration for the Fledgeling object
+
+    Returns
+    -------
+    results: Dict
+        The timings for each benchmark
+    """
+    from .fledgeling import Fledgeling
+    results = {}
+    fledges = []
+    _log.info("Benchmarking the setup")
+    results["setup"] = time_func(
+        lambda: fledges.append(Fledgeling(userconfig)), 1
+    )
+    fledge = fledges[0]
+    dr = fledge.dr
+    year = list(dr.conversion_tables.keys())[0]
+    flux = 1.66e-18 * (fledge.egrid / 1e5)**(-2.53)
+    _log.info("Benchmarking the folding")
+    results["fold"] = time_func(lambda: fledge.fold(flux), repeats)
+    _log.info("Benchmarking the effective area lookup")
+    results["effective area"] = time_func(
+        lambda: dr.effective_area_func(fledge.egrid, fledge.thetas, year),
+        repeats
+    )
+    fledge.close()
+    return results
@@ -3,6 +3,7 @@
 # Authors: Stephan Meighen-Berger
 # Config file for the fledgeling package.
 
+import copy
 import logging
 from typing import Dict, Any
 import yaml
@@ -31,14 +32,49 @@ _baseconfig = {
     # Atmospherics
     ###########################################################################
     "atmospherics": {
-        "name": "mceq",  # Options: mceq, FLUKA/HKKM
+        "name": "mceq",  # Options: mceq, hkkm, analytic
+        # Load the stored tables. If False (or not found) they are generated
+        "pre-computed": True,
         "mceq model": {
             "interaction model": 'SIBYLL2.3c',
             "primary model": ("HillasGaisser2012", "H3a"),
             "atmosphere": ('MSIS00', ('SouthPole', 'January')),
             "zeniths": [0, 10, 20, 30, 40, 50, 60, 70, 80],
-            "atmospheric storage": "data/shower.pkl"
-        }
+            "atmospheric storage": "data/shower.pkl",
+            # Storage of the monthly tables used by the seasonal prediction
+            "seasonal storage": "data/shower_%s.pkl",
+        },
+        # Tabulated fluxes in the format of Honda et al., interpolated in log-log
+        "hkkm model": {
+            "table": None,
+            # Used by the seasonal prediction if set. %s is the month
+            "seasonal table": None,
+            "zeniths": [0, 10, 20, 30, 40, 50, 60, 70, 80, 90],
+        },
+        # Closed-form conventional flux (Gaisser, Engel & Resconi 2016).
+        # Valid above roughly 100 GeV
+        "analytic model": {
+            "zeniths": [0, 10, 20, 30, 40, 50, 60, 70, 80, 90],
+            # Primary nucleons norm * E^-index in 1/(GeV cm^2 s sr)
+            "norm": 1.8,
+            "index": 2.7,
+            "Z_NN": 0.298,
+            # Pion and kaon contributions
+            "numu": {
+                "A_pi": 0.00689, "B_pi": 2.77, "epsilon_pi": 115.,
+                "A_K": 0.00256, "B_K": 1.18, "epsilon_K": 850.,
+            },
+            # Only K_e3 decays, tuned to nue / numu of roughly 1 / 20 at 1 TeV
+            "nue": {
+                "A_pi": 0., "B_pi": 2.77, "epsilon_pi": 115.,
+                "A_K": 0.00016, "B_K": 1.18, "epsilon_K": 850.,
+            },
+        },
+        # The months of the seasonal prediction in calendar order
+        "months": [
+            "January", "February", "March", "April", "May", "June", "July",
+            "August", "September", "October", "November", "December"
+        ],
     },
     ###########################################################################
     # Experimental data
@@ -98,6 +134,28 @@ _baseconfig = {
         ]
     },
     ###########################################################################
+    # Detector systematics
+    ###########################################################################
+    "systematics": {
+        # Grids of the nuisance parameters the response is pre-computed on
+        # Shift of the reconstructed energy in log10(E/GeV)
+        "energy scale": [-0.2, 0.2, 9],
+        # Relative width of the smearing
+        "smearing width": [0.8, 1.2, 9],
+    },
+    ###########################################################################
+    # Angular conversion tables
+    ###########################################################################
+    "angular tables": {
+        # Keep the PSF and angular error dimensions of the smearing matrix
+        "enabled": False,
+        # Location relative to the conversion dump. Built if not found
+        "storage": "data/icecube_angular.npz",
+        # In log10(deg)
+        "psf bins": [-2., 2.3, 44],
+        "angerr bins": [-1.5, 1.5, 31],
+    },
+    ###########################################################################
     # PDG ID Lib
     ###########################################################################
     "pdg id": {
@@ -131,11 +189,41 @@ _baseconfig = {
         # Storing loaded conversion tables, this is for advanced users
         "store conversion tables": False,
         # Relative path to the data folder (used for storing)
-        "conversion dump": "/home/unimelb.edu.au/smeighenberg/Projects/fledgeling/fledgeling/"
+        "conversion dump": "/home/unimelb.edu.au/smeighenberg/Projects/fledgeling/fledgeling/",
+        # Number of worker processes used when generating tables
+        "jobs": 1,
+        # Manifest of tables published in shared memory (see shared.py).
+        # If set, the data is attached to instead of loaded
+        "shared tables": None,
+        # Number of flux model evaluations kept (see fluxes.py)
+        "flux cache size": 256,
+        # Number of per-event PDF evaluations kept (see unbinned.py)
+        "event cache size": 16,
     },
 }
 
 
+def _deep_merge(base: Dict[Any, Any], update: Dict[Any, Any]) -> None:
+    """ Recursively merges a dictionary into another one (in place)
+
+    Parameters
+    ----------
+    base : dic
+        The dictionary to update
+    update : dic
+        The new values
+
+    Returns
+    -------
+    None
+    """
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _deep_merge(base[key], value)
+        else:
+            base[key] = copy.deepcopy(value)
+
+
 class ConfigClass(dict):
     """ The configuration class. This is used
     by the package for all parameter settings. If something goes wrong
@@ -154,9 +242,8 @@ class ConfigClass(dict):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    # TODO: Update this
     def from_yaml(self, yaml_file: str) -> None:
-        """ Update config with yaml file
+        """ Update config with yaml file. Nested sections are merged
 
         Parameters
         ----------
@@ -167,12 +254,12 @@ class ConfigClass(dict):
         -------
         None
         """
-        yaml_config = yaml.load(open(yaml_file), Loader=yaml.SafeLoader)
-        self.update(yaml_config)
+        with open(yaml_file) as f:
+            yaml_config = yaml.load(f, Loader=yaml.SafeLoader)
+        _deep_merge(self, yaml_config)
 
-    # TODO: Update this
     def from_dict(self, user_dict: Dict[Any, Any]) -> None:
-        """ Creates a config from dictionary
+        """ Updates the config from a dictionary. Nested sections are merged
 
         Parameters
         ----------
@@ -183,7 +270,109 @@ class ConfigClass(dict):
         -------
         None
         """
-        self.update(user_dict)
+        _deep_merge(self, user_dict)
+
+    def merged(self, userconfig=None) -> "ConfigClass":
+        """ Creates an independent copy of the config updated with the user settings
+
+        Parameters
+        ----------
+        userconfig : dic or str
+            The user dictionary or path to a yaml file
+
+        Returns
+        -------
+        merged : ConfigClass
+            The merged copy
+        """
+        merged = ConfigClass(copy.deepcopy(dict(self)))
+        if userconfig is not None:
+            if isinstance(userconfig, dict):
+                merged.from_dict(userconfig)
+            else:
+                merged.from_yaml(userconfig)
+        return merged
+
+    def freeze(self) -> "FrozenConfig":
+        """ Creates an immutable snapshot of the config
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        snapshot : FrozenConfig
+            The immutable config
+        """
+        return FrozenConfig(copy.deepcopy(dict(self)))
+
+
+class FrozenConfig(dict):
+    """ Immutable configuration snapshot. Nested sections are frozen as well
+    and lists are converted to tuples. Each Fledgeling object owns one of these,
+    so multiple objects with different settings can coexist
+
+    Parameters
+    ----------
+    config : dic
+        The config dictionary
+
+    Raises
+    ------
+    TypeError
+        When trying to change the config
+    """
+
+    def __init__(self, config: Dict[Any, Any]):
+        super().__init__({
+            key: self._freeze(value) for key, value in config.items()
+        })
+
+    @classmethod
+    def _freeze(cls, value: Any) -> Any:
+        if isinstance(value, dict):
+            return cls(value)
+        if isinstance(value, list):
+            return tuple(cls._freeze(item) for item in value)
+        return value
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("The config snapshot is immutable! Create a new one instead")
+
+    __setitem__ = _immutable
+    __delitem__ = _immutable
+    clear = _immutable
+    pop = _immutable
+    popitem = _immutable
+    setdefault = _immutable
+    update = _immutable
+
+    def __reduce__(self):
+        return (FrozenConfig, (dict(self),))
+
+    def to_dict(self) -> Dict[Any, Any]:
+        """ Converts the snapshot to a (mutable) nested dictionary
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        config : dic
+            The config as nested dictionaries. Tuples are converted to lists,
+            so the result can be dumped to (safe) yaml
+        """
+        return {key: self._thaw(value) for key, value in self.items()}
+
+    @classmethod
+    def _thaw(cls, value: Any) -> Any:
+        if isinstance(value, FrozenConfig):
+            return value.to_dict()
+        if isinstance(value, (list, tuple)):
+            return [cls._thaw(item) for item in value]
+        return value
 
 
 config = ConfigClass(_baseconfig)
@@ -4,19 +4,181 @@
 # Data reader for neutrino telescope data
 
 import logging
-import pkgutil
 import numpy as np
 import pickle as pkl
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import threading
 from tqdm import tqdm
-from .utils import ice_parser, dataframe_from2d
-from .config import config
+from .utils import ice_parser, columnar_from2d, read_stored, trapezoid
+from .shared import attach
 from scipy.interpolate import UnivariateSpline
 
 
 _log = logging.getLogger(__name__)
+# Parsed data is shared between all DR objects of the process
+_cache_lock = threading.Lock()
+# The MJD of the unix epoch (1970-01-01)
+_MJD_UNIX = 40587.
+# Seconds per day
+_DAY = 60. * 60. * 24.
+
+
+def _monthly_uptime(intervals: np.array) -> np.array:
+    """ Splits uptime intervals at the month boundaries and sums them per
+    calendar month
+
+    Parameters
+    ----------
+    intervals: np.array
+        The start and stop of each interval in MJD with shape (number of intervals, 2)
+
+    Returns
+    -------
+    uptime: np.array
+        The uptime in each calendar month (January to December) in seconds
+    """
+    start, stop = intervals[:, 0], intervals[:, 1]
+    first = np.datetime64(int(np.floor(np.min(start) - _MJD_UNIX)), "D").astype("datetime64[M]")
+    last = np.datetime64(int(np.floor(np.max(stop) - _MJD_UNIX)), "D").astype("datetime64[M]")
+    months = np.arange(first, last + 2)
+    edges = months.astype("datetime64[D]").astype(float) + _MJD_UNIX
+    overlap = np.clip(
+        np.minimum(stop[:, None], edges[None, 1:]) - np.maximum(start[:, None], edges[None, :-1]),
+        0., None
+    )
+    return np.bincount(
+        months[:-1].astype(int) % 12, weights=np.sum(overlap, axis=0) * _DAY, minlength=12
+    )
+
+
+@lru_cache(maxsize=None)
+def _read_icecube(
+        storage_location: str,
+        aeff_files: tuple,
+        event_files: tuple,
+        smearing_files: tuple,
+        uptime_files: tuple) -> tuple:
+    """ parses icecube data. The results are cached and read-only, since they are
+    shared between DR objects
+
+    Parameters
+    ----------
+    storage_location: str
+        The folder containing the data
+    aeff_files: tuple
+        The effective area files
+    event_files: tuple
+        The event files
+    smearing_files: tuple
+        The smearing matrix files
+    uptime_files: tuple
+        The uptime files
+
+    Returns
+    -------
+    aeff_dic: ColumnarTable
+        The effective areas
+    event_dic: ColumnarTable
+        The events
+    smearing_dic: ColumnarTable
+        The smearing matrices
+    uptime_tot_dic: dict
+        The total uptime for each year in seconds
+    uptime_month_dic: dict
+        The uptime in each calendar month for each year in seconds
+    """
+    seconds = 60.
+    minutes = 60.
+    days = seconds * minutes * 24.
+    aeff_dic = {}
+    smearing_dic = {}
+    event_dic = {}
+    uptime_dic = {}
+    uptime_tot_dic = {}
+    uptime_month_dic = {}
+    # Files used for multiple years are only parsed (and stored) once
+    parsed = {}
+    def parse(datafile):
+        if datafile not in parsed:
+            parsed[datafile] = ice_parser(storage_location + datafile)
+        return parsed[datafile]
+    _log.info("Loading effective area data")
+    for i, datafile in enumerate(aeff_files):
+        aeff_dic[i] = parse(datafile)
+    # IceCube effective areas in the last few years is the same
+    aeff_dic[5] = aeff_dic[4]
+    aeff_dic[6] = aeff_dic[4]
+    aeff_dic[7] = aeff_dic[4]
+    aeff_dic[8] = aeff_dic[4]
+    aeff_dic[9] = aeff_dic[4]
+    _log.info("Loading event data")
+    for i, datafile in enumerate(event_files):
+        event_dic[i] = parse(datafile)
+    _log.info("Loading the smearing matrix")
+    for i, datafile in enumerate(smearing_files):
+        smearing_dic[i] = parse(datafile)
+    _log.info("Loading the uptimes")
+    for i, datafile in enumerate(uptime_files):
+        uptime_dic[i] = parse(datafile)
+    for year in range(10):
+       uptime_tot_dic[year] = np.sum(np.diff(uptime_dic[year])) * days
+       uptime_month_dic[year] = _monthly_uptime(uptime_dic[year])
+       uptime_month_dic[year].setflags(write=False)
+    _log.info("Converting to columnar tables")
+    aeff_dic = columnar_from2d(
+        aeff_dic,
+        column_names=["E_min", "E_max", "dec_min", "dec_max", "aeff"],
+        bin_columns=["E_min", "E_max", "dec_min", "dec_max"]
+    )
+    event_dic = columnar_from2d(
+        event_dic,
+        column_names=["MJD", "E", "angerr", "ra", "dec", "azimuth", "zenith"],
+        dtypes={"MJD": np.float64}
+    )
+    smearing_dic = columnar_from2d(
+        smearing_dic,
+        column_names=[
+            "E_min", "E_max", "dec_min", "dec_max", "E_rec_min", "E_rec_max", "PSF_min", "PSF_max",
+            "angerr_min", "angerr_max", "fractional_counts"
+        ],
+        bin_columns=[
+            "E_min", "E_max", "dec_min", "dec_max", "E_rec_min", "E_rec_max", "PSF_min", "PSF_max",
+            "angerr_min", "angerr_max"
+        ]
+    )
+    for table in [aeff_dic, event_dic, smearing_dic]:
+        table.set_read_only()
+    return aeff_dic, event_dic, smearing_dic, uptime_tot_dic, uptime_month_dic
+
+
+@lru_cache(maxsize=None)
+def _load_tables(tables: str, dump: str) -> dict:
+    """ Loads pre-computed conversion tables from the conversion dump or the
+    package. The results are cached and read-only, since they are shared
+    between DR objects
+
+    Parameters
+    ----------
+    tables: str
+        The tables location relative to the conversion dump and the package
+    dump: str
+        The conversion dump the tables are stored in
+
+    Returns
+    -------
+    conversion_tables: dict
+        The conversion tables for each year
+    """
+    conversion_tables = pkl.loads(read_stored(tables, dump))
+    for table in conversion_tables.values():
+        table.setflags(write=False)
+    return conversion_tables
+
 
 class DR(object):
-    """ data reader class. This handles the loading parsing and setup of external or pre-calculated data
+    """ data reader class. This handles the loading parsing and setup of external or pre-calculated data.
+    Parsed data and loaded tables are shared (read-only) between DR objects using the same files
 
     Parameters
     ----------
@@ -24,10 +186,22 @@ class DR(object):
         The energy grid to evaluate on. Should have units GeV
     thetas: np.array
         The thetas to evaluate for
+    years: list
+        The years to evaluate for
+    config: dic
+        The configuration (snapshot) to use
     """
-    def __init__(self, egrid: np.array, thetas: np.array, years: list):
-        if not config["general"]["enable logging"]:
-            _log.disabled = True
+    def __init__(self, egrid: np.array, thetas: np.array, years: list, config: dict):
+        self._config = config
+        if config["advanced"]["shared tables"] is not None:
+            _log.info("Attaching to the shared tables")
+            self.sim_to_dec = self._sim_to_dec_icecube
+            self._shared_reader()
+            if self._conversion_tables[years[0]].shape[:2] != (len(thetas), len(egrid)):
+                raise ValueError(
+                    "The shared tables do not match the grids! Check the config file"
+                )
+            return
         if config["general"]["detector"] == "icecube":
             _log.info("Running for icecube")
             self.sim_to_dec = self._sim_to_dec_icecube
@@ -36,18 +210,28 @@ class DR(object):
             _log.error("Unknown detector! Check the config file")
         if config["experimental data"]["pre-computed"]:
             _log.info("Loading pre-computed experimental data")
-            param_file = pkgutil.get_data(
-                    __name__,
-                    config["experimental data"]["tables"]
-            )
-            self._conversion_tables = pkl.loads(param_file)
+            with _cache_lock:
+                self._conversion_tables = dict(
+                    _load_tables(
+                        config["experimental data"]["tables"],
+                        config["advanced"]["conversion dump"]
+                    )
+                )
         else:
             _log.info("Loading experimental data")
             _log.info("Generating conversion tables")
-            self._conversion_tables = {}
-            for year in years:
-                _log.info("Currently generating tables for year %d" % year)
-                self._conversion_tables[year] = self.sim_to_dec(np.log10(egrid), egrid, thetas, year)
+            jobs = config["advanced"]["jobs"]
+            if jobs > 1:
+                _log.info("Generating the years on %d processes" % jobs)
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    self._conversion_tables = dict(zip(years, executor.map(
+                        partial(self.sim_to_dec, np.log10(egrid), egrid, thetas), years
+                    )))
+            else:
+                self._conversion_tables = {}
+                for year in years:
+                    _log.info("Currently generating tables for year %d" % year)
+                    self._conversion_tables[year] = self.sim_to_dec(np.log10(egrid), egrid, thetas, year)
             if config["advanced"]["store conversion tables"]:
                 _log.info("Dumping conversion tables")
                 with open(config["advanced"]["conversion dump"] + config["experimental data"]["tables"], "wb") as f:
@@ -60,6 +244,19 @@ class DR(object):
         """
         return self._conversion_tables
 
+    @property
+    def livetimes(self):
+        """ Total uptime of each year in seconds
+        """
+        return self._uptime_tot_dic
+
+    @property
+    def monthly_livetimes(self):
+        """ Uptime of each year split into the calendar months (January to December)
+        in seconds
+        """
+        return self._uptime_month_dic
+
     def _icecube_reader(self):
         """ parses icecube data
 
@@ -71,55 +268,38 @@ class DR(object):
         -------
         None
         """
-        seconds = 60.
-        minutes = 60.
-        days = seconds * minutes * 24.
-        self._aeff_dic = {}
-        self._smearing_dic = {}
-        self._event_dic = {}
-        uptime_dic = {}
-        self._uptime_tot_dic = {}
-        storage_location = config["experimental data"]["filepath"]
-        _log.info("Loading effective area data")
-        for i, datafile in enumerate(config["icecube data"]["effective areas"]):
-            self._aeff_dic[i] = ice_parser(storage_location + datafile)
-        # IceCube effective areas in the last few years is the same
-        self._aeff_dic[5] = self._aeff_dic[4]
-        self._aeff_dic[6] = self._aeff_dic[4]
-        self._aeff_dic[7] = self._aeff_dic[4]
-        self._aeff_dic[8] = self._aeff_dic[4]
-        self._aeff_dic[9] = self._aeff_dic[4]
-        _log.info("Loading event data")
-        for i, datafile in enumerate(config["icecube data"]["event data"]):
-            self._event_dic[i] = ice_parser(storage_location + datafile)
-        _log.info("Loading the smearing matrix")
-        for i, datafile in enumerate(config["icecube data"]["smearing matrix"]):
-            self._smearing_dic[i] = ice_parser(storage_location + datafile)
-        _log.info("Loading the uptimes")
-        for i, datafile in enumerate(config["icecube data"]["uptime"]):
-            uptime_dic[i] = ice_parser(storage_location + datafile)
-        for year in range(10):
-           self._uptime_tot_dic[year] = np.sum(np.diff(uptime_dic[year])) * days
-        _log.info("Converting to pandas dataframe objects")
-        
-        self._aeff_dic = dataframe_from2d(
-            self._aeff_dic,
-            column_names=["E_min", "E_max", "dec_min", "dec_max", "aeff"],
-            new_col_name="year"
-        )
-        self._event_dic = dataframe_from2d(
-            self._event_dic,
-            column_names=["MJD", "E", "angerr", "ra", "dec", "azimuth", "zenith"],
-            new_col_name="year"
-        )
-        self._smearing_dic = dataframe_from2d(
-            self._smearing_dic,
-            column_names=[
-                "E_min", "E_max", "dec_min", "dec_max", "E_rec_min", "E_rec_max", "PSF_min", "PSF_max",
-                "angerr_min", "angerr_max", "fractional_counts"
-            ],
-            new_col_name="year"
-        )
+        with _cache_lock:
+            (
+                self._aeff_dic, self._event_dic, self._smearing_dic, uptime_tot_dic,
+                uptime_month_dic
+            ) = _read_icecube(
+                self._config["experimental data"]["filepath"],
+                tuple(self._config["icecube data"]["effective areas"]),
+                tuple(self._config["icecube data"]["event data"]),
+                tuple(self._config["icecube data"]["smearing matrix"]),
+                tuple(self._config["icecube data"]["uptime"]),
+            )
+        self._uptime_tot_dic = dict(uptime_tot_dic)
+        self._uptime_month_dic = dict(uptime_month_dic)
+
+    def _shared_reader(self):
+        """ attaches to data published in shared memory
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        shared = attach(self._config["advanced"]["shared tables"])
+        self._aeff_dic = shared["aeff"]
+        self._event_dic = shared["events"]
+        self._smearing_dic = shared["smearing"]
+        self._uptime_tot_dic = dict(shared["livetimes"])
+        self._uptime_month_dic = dict(shared["monthly livetimes"])
+        self._conversion_tables = dict(shared["conversion tables"])
 
     def effective_area_func(
             self,
@@ -144,8 +324,13 @@ class DR(object):
             The shape will be (len(thetas), len(e_grid)), with the rows corresponding
             to the angles while the columns to the energies
         """
-        # Filtering the year
-        y_aeff = self._aeff_dic[self._aeff_dic["year"] == year]
+        # Fetching the year
+        y_aeff = self._aeff_dic.year(year)
+        e_min = y_aeff["E_min"]
+        e_max = y_aeff["E_max"]
+        dec_min = y_aeff["dec_min"]
+        dec_max = y_aeff["dec_max"]
+        aeff = y_aeff["aeff"]
         # Converting to declination
         tmp_thetas = np.array([
             -(90. - theta) if theta < 90
@@ -156,12 +341,12 @@ class DR(object):
         # creating mask arrays
         # Energy
         emasks = np.array([
-            (y_aeff['E_min'] <= elog) & (y_aeff['E_max'] > elog)
+            (e_min <= elog) & (e_max > elog)
             for elog in np.log10(e_grid)
         ])
         # Angles
         amasks = np.array([
-            (y_aeff['dec_min'] <= theta) & (y_aeff["dec_max"] > theta)
+            (dec_min <= theta) & (dec_max > theta)
             for theta in tmp_thetas
         ])
         # All masks
@@ -172,7 +357,7 @@ class DR(object):
         _log.debug("Fetching the values")
         # Fetching values
         aeff_val = np.array([[
-            y_aeff[mask]["aeff"].values for mask in esub
+            aeff[mask] for mask in esub
         ] for esub in eamasks], dtype=object)
         _log.debug("Finished")
         return aeff_val
@@ -205,8 +390,14 @@ class DR(object):
             The shape will be (len(thetas), len(e_grid), len(reco_grid)), with the rows corresponding
             to the angles while the columns to the energies
         """
-        # Filtering the year
-        y_smear = self._smearing_dic[self._smearing_dic["year"] == year]
+        # Fetching the year
+        y_smear = self._smearing_dic.year(year)
+        e_min = y_smear["E_min"]
+        e_max = y_smear["E_max"]
+        dec_min = y_smear["dec_min"]
+        dec_max = y_smear["dec_max"]
+        frac_counts = y_smear["fractional_counts"]
+        e_rec = (y_smear["E_rec_min"] + y_smear["E_rec_max"]) / 2
         # Converting to declination
         tmp_thetas = np.array([
             -(90. - theta) if theta < 90
@@ -217,37 +408,113 @@ class DR(object):
         # creating mask arrays
         # Energy
         emasks = np.array([
-            (y_smear['E_min'] <= elog) & (y_smear['E_max'] > elog)
+            (e_min <= elog) & (e_max > elog)
             for elog in np.log10(e_grid)
         ])
         # Angles
         amasks = np.array([
-            (y_smear['dec_min'] <= theta) & (y_smear["dec_max"] > theta)
+            (dec_min <= theta) & (dec_max > theta)
             for theta in tmp_thetas
         ])
         _log.debug("Finished energy and angle masks")
         _log.debug("Combining masks...")
-        # # All masks
-        # TODO: make this memory efficient. Probably through pre-allocation
-        # eamasks = np.array([[
-        #     np.logical_and(emask, amask) for emask in emasks
-        # ] for amask in amasks])
-        # _log.debug("Finished mask arrays for smearing")
-        # # Fetching values
-        # smearing_val = np.array([[
-        #     np.sum(y_smear[mask]["fractional_counts"].values.reshape((int(len(y_smear[mask]["fractional_counts"].values) / 440)), 440), axis=1) for mask in esub
-        # ] for esub in eamasks], dtype=object)
-        # smearing_egrid = np.array([[
-        #     (y_smear[mask]["E_rec_min"].values + y_smear[mask]["E_rec_max"].values).reshape((int(len(y_smear[mask]["fractional_counts"].values) / 440)), 440)[:, 0] / 2 for mask in esub
-        # ] for esub in eamasks], dtype=object)
+        # The 440 PSF x angular error bins per reconstructed energy are summed over
         smearing_val = np.array([[
-            np.sum(y_smear[np.logical_and(mask, esub)]["fractional_counts"].values.reshape((int(len(y_smear[np.logical_and(mask, esub)]["fractional_counts"].values) / 440)), 440), axis=1) for mask in emasks
+            np.sum(frac_counts[np.logical_and(mask, esub)].reshape(-1, 440), axis=1) for mask in emasks
         ] for esub in amasks], dtype=object)
         smearing_egrid = np.array([[
-            (y_smear[np.logical_and(mask, esub)]["E_rec_min"].values + y_smear[np.logical_and(mask, esub)]["E_rec_max"].values).reshape((int(len(y_smear[np.logical_and(mask, esub)]["fractional_counts"].values) / 440)), 440)[:, 0] / 2 for mask in emasks
+            e_rec[np.logical_and(mask, esub)].reshape(-1, 440)[:, 0] for mask in emasks
         ] for esub in amasks], dtype=object)
         return smearing_val, smearing_egrid
 
+    def angular_fractions(
+            self,
+            e_grid: np.array,
+            thetas: np.array,
+            year: int,
+            unigrid: np.array,
+            psf_bins: np.array,
+            angerr_bins: np.array):
+        """ Angular (PSF and angular error) distributions of the smearing matrix.
+        These only change between the cells of the smearing matrix, so they are
+        stored once per cell together with the cell of each energy and angle
+
+        Parameters
+        ----------
+        e_grid: np.array
+            The energies to evaluate for
+        thetas: np.array
+            The theta angles to evaluate for
+        year: int
+            The year of interest
+        unigrid: np.array
+            The reconstructed energy grid as log10(E/GeV)
+        psf_bins: np.array
+            The PSF bin edges in degrees. Values outside are put into the outer bins
+        angerr_bins: np.array
+            The angular error bin edges in degrees. Values outside are put into the outer bins
+
+        Returns
+        -------
+        cells: np.array
+            The cell of each theta and energy with shape (len(thetas), len(e_grid)).
+            -1 if there is none
+        fractions: np.array
+            The fraction of counts in each PSF and angular error bin for each cell and
+            reconstructed energy. The shape is (number of cells, len(unigrid),
+            len(psf_bins) - 1, len(angerr_bins) - 1)
+        """
+        y_smear = self._smearing_dic.year(year)
+        cell_codes = np.stack([y_smear.codes("E_min"), y_smear.codes("dec_min")])
+        cell_codes, first, row_cells = np.unique(
+            cell_codes, axis=1, return_index=True, return_inverse=True
+        )
+        row_cells = row_cells.reshape(-1)
+        e_min = y_smear["E_min"][first]
+        e_max = y_smear["E_max"][first]
+        dec_min = y_smear["dec_min"][first]
+        dec_max = y_smear["dec_max"][first]
+        # Converting to declination
+        tmp_thetas = np.where(thetas < 90, -(90. - thetas), thetas - 90)
+        elog = np.log10(e_grid)
+        in_cell = (
+            ((e_min <= elog[:, None]) & (e_max > elog[:, None]))[None, :, :] &
+            ((dec_min <= tmp_thetas[:, None]) & (dec_max > tmp_thetas[:, None]))[:, None, :]
+        )
+        cells = np.where(np.any(in_cell, axis=-1), np.argmax(in_cell, axis=-1), -1)
+        e_rec = (y_smear["E_rec_min"] + y_smear["E_rec_max"]) / 2
+        psf_idx = np.clip(
+            np.searchsorted(psf_bins, (y_smear["PSF_min"] + y_smear["PSF_max"]) / 2) - 1,
+            0, len(psf_bins) - 2
+        )
+        angerr_idx = np.clip(
+            np.searchsorted(angerr_bins, (y_smear["angerr_min"] + y_smear["angerr_max"]) / 2) - 1,
+            0, len(angerr_bins) - 2
+        )
+        frac_counts = y_smear["fractional_counts"]
+        fractions = np.zeros(
+            (len(first), len(unigrid), len(psf_bins) - 1, len(angerr_bins) - 1),
+            dtype=np.float32
+        )
+        for cell in range(len(first)):
+            rows = row_cells == cell
+            rec_grid, rec_idx = np.unique(e_rec[rows], return_inverse=True)
+            hist = np.zeros((len(rec_grid), len(psf_bins) - 1, len(angerr_bins) - 1))
+            np.add.at(hist, (rec_idx.reshape(-1), psf_idx[rows], angerr_idx[rows]), frac_counts[rows])
+            norm = np.sum(hist, axis=(1, 2), keepdims=True)
+            hist = np.divide(hist, norm, out=np.zeros_like(hist), where=norm > 0.)
+            # Linear interpolation onto the reconstructed energy grid
+            identity = np.eye(len(rec_grid))
+            weights = np.array([
+                np.interp(unigrid, rec_grid, identity[i]) for i in range(len(rec_grid))
+            ])
+            interpolated = np.einsum("ru,rpa->upa", weights, hist)
+            norm = np.sum(interpolated, axis=(1, 2), keepdims=True)
+            fractions[cell] = np.divide(
+                interpolated, norm, out=np.zeros_like(interpolated), where=norm > 0.
+            )
+        return cells, fractions
+
     def smearing_splines(
             self, 
             smearing_egrid: np.array,
@@ -322,7 +589,7 @@ class DR(object):
         _log.debug("Finished smearing counts")
         spl = self.smearing_splines(x, y)
         smeared_counts = np.array([[
-            unnormalized_counts[i][j] * spl[i][j](unigrid) / np.trapz(spl[i][j](unigrid), x=unigrid)
+            unnormalized_counts[i][j] * spl[i][j](unigrid) / trapezoid(spl[i][j](unigrid), x=unigrid)
             if np.sum(spl[i][j](unigrid)) > 0. else np.zeros(len(unigrid))
             for j in range(len(unnormalized_counts[i]))
             ] for i in range(len(unnormalized_counts))], dtype=float)
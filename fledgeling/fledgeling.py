@@ -6,8 +6,12 @@
 
 # Imports
 # Native modules
+import asyncio
 import logging
+import os
 import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import numpy as np
 import yaml
 # -----------------------------------------
@@ -15,9 +19,71 @@ import yaml
 from .config import config
 from .data_reader import DR
 from .atmospherics import Atmos
+from .systematics import Systematics
+from .unfolding import Unfolding
+from .angular import AngularTables, build_angular_tables
+from .fluxes import FluxModels
+from .seasonal import Seasonal
+from .unbinned import UnbinnedLikelihood
+from .utils import theta_mask, theta_weights
 
 # unless we put this class in __init__, __name__ will be contagion.contagion
 _log = logging.getLogger("fledgeling")
+# The handlers are shared by all Fledgeling objects of the process
+_handler_lock = threading.Lock()
+_handlers = {}
+
+
+def _setup_logging(config: dict) -> None:
+    """ Adds the console and file handlers to the package logger. Each handler is
+    only added once per process, so objects neither duplicate nor silence each
+    other's output. The console uses the most verbose level requested so far
+
+    Parameters
+    ----------
+    config: dic
+        The configuration (snapshot) of the object
+
+    Returns
+    -------
+    None
+    """
+    # Logging formatter
+    fmt = "%(levelname)s: %(message)s"
+    fmt_with_name = "[%(name)s] " + fmt
+    formatter_with_name = logging.Formatter(fmt=fmt_with_name)
+    with _handler_lock:
+        _log.setLevel(logging.DEBUG)
+        # creating file handler with debug messages
+        log_file = config["general"]["log file handler"]
+        if config["general"]["enable logging"] and ("file", log_file) not in _handlers:
+            fh = logging.FileHandler(log_file, mode="w")
+            fh.setLevel(logging.DEBUG)
+            fh.setFormatter(formatter_with_name)
+            _log.addHandler(fh)
+            _handlers[("file", log_file)] = fh
+        # console logger with a higher log level
+        ch = _handlers.get("console")
+        if ch is None:
+            ch = logging.StreamHandler(sys.stdout)
+            ch.setLevel(config["general"]["debug level"])
+            _log.addHandler(ch)
+            _handlers["console"] = ch
+        else:
+            ch.setLevel(min(ch.level, config["general"]["debug level"]))
+        # add class name to ch only when debugging
+        if ch.level == logging.DEBUG:
+            ch.setFormatter(formatter_with_name)
+        else:
+            ch.setFormatter(logging.Formatter(fmt=fmt))
+
+
+def _completed(result) -> Future:
+    """ Wraps an already available result in a finished future
+    """
+    future = Future()
+    future.set_result(result)
+    return future
 
 
 class Fledgeling(object):
@@ -34,63 +100,46 @@ class Fledgeling(object):
     -------
     None
     """
-    def __init__(self, userconfig=None):
+    def __init__(self, userconfig=None, background=False, executor=None):
         """
         function: __init__
         Initializes the class fledgeling.
         Here all run parameters are set.
         Parameters
         ----------
-        config : dic
-            Configuration dictionary for the simulation
+        userconfig : dic or str
+            Configuration dictionary or yaml file for the simulation.
+            It is merged with the global config
+        background: bool
+            Load the data and atmospherics concurrently in the background.
+            The constructor returns immediately and the first use waits for them
+        executor: concurrent.futures.Executor
+            The pool to load in when loading in the background. Defaults to a
+            new thread pool. With a process pool the loaded objects are sent
+            back to this process
 
         Returns
         -------
         None
         """
         # Inputs
-        if userconfig is not None:
-            if isinstance(userconfig, dict):
-                config.from_dict(userconfig)
-            else:
-                config.from_yaml(userconfig)
+        # Each object owns an immutable snapshot of the config. The global
+        # config only provides the defaults
+        conf = config.merged(userconfig)
 
         # Create RandomState
-        if config["general"]["random state seed"] is None:
+        if conf["general"]["random state seed"] is None:
             _log.warning("No random state seed given, constructing new state")
             rstate = np.random.RandomState()
         else:
             rstate = np.random.RandomState(
-                config["general"]["random state seed"]
+                conf["general"]["random state seed"]
             )
-        config["runtime"] = {"random state": rstate}
+        conf["runtime"] = {"random state": rstate}
+        self._config = conf.freeze()
 
         # Logger
-        # Logging formatter
-        fmt = "%(levelname)s: %(message)s"
-        fmt_with_name = "[%(name)s] " + fmt
-        formatter_with_name = logging.Formatter(fmt=fmt_with_name)
-        # creating file handler with debug messages
-        if config["general"]["enable logging"]:
-            fh = logging.FileHandler(
-                config["general"]["log file handler"], mode="w"
-            )
-            fh.setLevel(logging.DEBUG)
-            fh.setFormatter(formatter_with_name)
-            _log.addHandler(fh)
-        else:
-            _log.disabled = True
-        # console logger with a higher log level
-        ch = logging.StreamHandler(sys.stdout)
-        ch.setLevel(config["general"]["debug level"])
-        # add class name to ch only when debugging
-        if config["general"]["debug level"] == logging.DEBUG:
-            ch.setFormatter(formatter_with_name)
-        else:
-            formatter = logging.Formatter(fmt=fmt)
-            ch.setFormatter(formatter)
-        _log.addHandler(ch)
-        _log.setLevel(logging.DEBUG)
+        _setup_logging(self._config)
         _log.info('---------------------------------------------------')
         _log.info('---------------------------------------------------')
         _log.info('Welcome to Fledgeling!')
@@ -101,29 +150,407 @@ class Fledgeling(object):
         _log.info('---------------------------------------------------')
         _log.info('Doing some prelim setup')
         self._ebins = np.logspace(
-            config["advanced"]["ebins"][0],
-            config["advanced"]["ebins"][1],
-            config["advanced"]["ebins"][2]
+            self._config["advanced"]["ebins"][0],
+            self._config["advanced"]["ebins"][1],
+            self._config["advanced"]["ebins"][2]
         )
         self._ewidths = self._ebins[1:] - self._ebins[:-1]
         self._egrid = np.sqrt(self._ebins[1:] * self._ebins[:-1])
         self._thetas = np.arange(
-            config["advanced"]["thetas"][0],
-            config["advanced"]["thetas"][1],
-            config["advanced"]["thetas"][2]
+            self._config["advanced"]["thetas"][0],
+            self._config["advanced"]["thetas"][1],
+            self._config["advanced"]["thetas"][2]
         )
-        self._years = range(0, config["advanced"]["years"])
+        self._years = range(0, self._config["advanced"]["years"])
         _log.info('---------------------------------------------------')
         _log.info('---------------------------------------------------')
-        _log.info('Loading the flux to event conversion function')
-        self._dr = DR(self._egrid, self._thetas, self._years)
+        if background:
+            # DR and Atmos are independent. Both are loaded concurrently and
+            # only waited for when first used
+            _log.info('Loading the flux to event conversion function and')
+            _log.info('the atmospheric shower simulation in the background')
+            pool = executor
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=2)
+            self._dr_future = pool.submit(
+                DR, self._egrid, self._thetas, self._years, self._config
+            )
+            self._atmos_future = pool.submit(
+                Atmos, self._ebins, self._thetas, self._config
+            )
+            if executor is None:
+                # The workers exit once the loads are done
+                pool.shutdown(wait=False)
+        else:
+            _log.info('Loading the flux to event conversion function')
+            self._dr_future = _completed(
+                DR(self._egrid, self._thetas, self._years, self._config)
+            )
+            _log.info('---------------------------------------------------')
+            _log.info('---------------------------------------------------')
+            _log.info('Launching or loading the atmospheric shower simulation')
+            self._atmos_future = _completed(
+                Atmos(self._ebins, self._thetas, self._config)
+            )
+        self._fluxes = FluxModels(self)
+        self._angular_lock = threading.Lock()
+        self._angular = None
+        if not background:
+            self._load_angular()
         _log.info('---------------------------------------------------')
         _log.info('---------------------------------------------------')
-        _log.info('Launching or loading the atmospheric shower simulation')
-        self._atmos = Atmos()
+
+    @classmethod
+    async def create(cls, userconfig=None, executor=None):
+        """ Constructs a fledgeling object from within asyncio. The data and
+        atmospherics are loaded in the background without blocking the event loop
+
+        Parameters
+        ----------
+        userconfig : dic or str
+            Configuration dictionary or yaml file for the simulation.
+            It is merged with the global config
+        executor: concurrent.futures.Executor
+            The pool to load in. Defaults to a new thread pool
+
+        Returns
+        -------
+        fledge: Fledgeling
+            The fully loaded object
+        """
+        fledge = cls(userconfig, background=True, executor=executor)
+        await fledge.wait_async()
+        return fledge
+
+    def _load_angular(self):
+        """ Loads or builds the angular tables if they are enabled
+        """
+        if not self._config["angular tables"]["enabled"]:
+            return
         _log.info('---------------------------------------------------')
         _log.info('---------------------------------------------------')
+        _log.info('Loading or building the angular tables')
+        angular_config = self._config["angular tables"]
+        angular_file = (
+            self._config["advanced"]["conversion dump"] + angular_config["storage"]
+        )
+        if not os.path.isfile(angular_file):
+            build_angular_tables(
+                self.dr, self._egrid, self._thetas, self._years,
+                np.logspace(*angular_config["psf bins"]),
+                np.logspace(*angular_config["angerr bins"]),
+                angular_file
+            )
+        self._angular = AngularTables(angular_file, self.dr.conversion_tables)
+
+    @property
+    def ready(self):
+        """ If the data and atmospherics are loaded
+        """
+        return self._dr_future.done() and self._atmos_future.done()
+
+    def wait(self, timeout=None):
+        """ Blocks until the data and atmospherics are loaded. Errors raised
+        while loading are raised here
+
+        Parameters
+        ----------
+        timeout: float
+            Maximum time to wait for each in seconds. Defaults to no limit
+
+        Returns
+        -------
+        None
+        """
+        self._dr_future.result(timeout)
+        self._atmos_future.result(timeout)
+
+    async def wait_async(self):
+        """ Awaits the data and atmospherics. Errors raised while loading
+        are raised here
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        await asyncio.gather(
+            asyncio.wrap_future(self._dr_future),
+            asyncio.wrap_future(self._atmos_future)
+        )
+
+    @property
+    def dr(self):
+        """ The data reader. Waits for it when loaded in the background
+        """
+        return self._dr_future.result()
+
+    @property
+    def atmos(self):
+        """ The atmospheric flux. Waits for it when loaded in the background
+        """
+        return self._atmos_future.result()
+
+    # Kept for existing code using the private names
+    _dr = dr
+    _atmos = atmos
+
+    @property
+    def config(self):
+        """ The (immutable) configuration snapshot of this object
+        """
+        return self._config
+
+    @property
+    def ebins(self):
+        """ The (injected) energy bin edges in GeV
+        """
+        return self._ebins
+
+    @property
+    def egrid(self):
+        """ The (injected) energy grid in GeV
+        """
+        return self._egrid
+
+    @property
+    def ewidths(self):
+        """ The widths of the energy grid bins in GeV
+        """
+        return self._ewidths
+
+    @property
+    def thetas(self):
+        """ The (injected) theta grid in degrees
+        """
+        return self._thetas
+
+    @property
+    def fluxes(self):
+        """ The flux models evaluated on the energy grid. See FluxModels
+        """
+        return self._fluxes
+
+    @property
+    def angular(self):
+        """ The angular tables. None if they are disabled.
+        When loading in the background they are loaded on first use
+        """
+        with self._angular_lock:
+            if self._angular is None:
+                self._load_angular()
+        return self._angular
+
+    def _theta_mask(self, theta_range=None) -> np.array:
+        """ Mask of the thetas within [min, max). All if theta_range is None
+        """
+        return theta_mask(self._thetas, theta_range)
+
+    def fold(
+            self,
+            flux: np.array,
+            years=None,
+            theta_range=None,
+            tables=None,
+            integrated=False) -> dict:
+        """ Folds a flux with the conversion tables and livetimes to get the
+        expected counts in reconstructed energy
 
+        Parameters
+        ----------
+        flux: np.array
+            The differential flux evaluated on the energy grid in 1/(GeV cm^2 s sr).
+            Either of shape (len(egrid),) or (len(thetas), len(egrid))
+        years: list
+            The years to fold for. Defaults to all years
+        theta_range: list
+            The [min, max) range of the injected theta angles to integrate over
+            in degrees. Defaults to all angles. The counts of adjacent ranges
+            add up to the counts of the combined range
+        tables: dict
+            Conversion tables to use instead of the DR ones, e.g. with
+            modified detector systematics
+        integrated: bool
+            If the flux is already integrated over the energy bins in 1/(cm^2 s sr)
+
+        Returns
+        -------
+        counts: dict
+            The expected counts on the reconstructed energy grid for each year
+        """
+        if years is None:
+            years = self._years
+        if tables is None:
+            tables = self.dr.conversion_tables
+        theta_mask = self._theta_mask(theta_range)
+        if not integrated:
+            flux = flux * self._ewidths
+        weights = np.broadcast_to(
+            flux, (len(self._thetas), len(self._egrid))
+        )[theta_mask] * theta_weights(self._thetas, theta_mask)[:, None]
+        counts = {}
+        for year in years:
+            # Same normalization as used in the examples
+            counts[year] = np.einsum(
+                "te,ter->r", weights, tables[year][theta_mask]
+            ) / 100 * self.dr.livetimes[year]
+        return counts
+
+    def fold_angular(
+            self,
+            flux: np.array,
+            keep=("psf", "angerr"),
+            years=None,
+            theta_range=None,
+            integrated=False) -> dict:
+        """ Folds a flux with the angular tables. The axes not kept are
+        marginalized on the fly
+
+        Parameters
+        ----------
+        flux: np.array
+            The differential flux evaluated on the energy grid in 1/(GeV cm^2 s sr).
+            Either of shape (len(egrid),) or (len(thetas), len(egrid))
+        keep: tuple
+            The angular axes to keep, any of "psf" and "angerr"
+        years: list
+            The years to fold for. Defaults to all years
+        theta_range: list
+            The [min, max) range of the injected theta angles to integrate over
+            in degrees. Defaults to all angles
+        integrated: bool
+            If the flux is already integrated over the energy bins in 1/(cm^2 s sr)
+
+        Returns
+        -------
+        counts: dict
+            The expected counts for each year with shape (len(egrid), kept axes...)
+
+        Raises
+        ------
+        ValueError
+            The angular tables are disabled
+        """
+        angular = self.angular
+        if angular is None:
+            raise ValueError("The angular tables are disabled! Check the config file")
+        if years is None:
+            years = self._years
+        theta_mask = self._theta_mask(theta_range)
+        if not integrated:
+            flux = flux * self._ewidths
+        # Same integration over the thetas as in fold
+        weights = np.broadcast_to(
+            flux, (len(self._thetas), len(self._egrid))
+        )[theta_mask] * theta_weights(self._thetas, theta_mask)[:, None]
+        counts = {}
+        for year in years:
+            # Same normalization as used in fold
+            counts[year] = angular.fold(
+                weights, year, theta_mask, keep=keep
+            ) / 100 * self.dr.livetimes[year]
+        return counts
+
+    def atmospheric_counts(self, flavor="numu", years=None, theta_range=None) -> dict:
+        """ Folds the atmospheric flux into expected counts. The flux is already
+        projected onto the energy and theta grids by Atmos
+
+        Parameters
+        ----------
+        flavor: str
+            The neutrino flavor, "numu" or "nue"
+        years: list
+            The years to fold for. Defaults to all years
+        theta_range: list
+            The [min, max) range of the injected theta angles to integrate over
+            in degrees. Defaults to all angles
+
+        Returns
+        -------
+        counts: dict
+            The expected counts on the reconstructed energy grid for each year
+        """
+        return self.fold(
+            self.atmos.binned[flavor], years=years, theta_range=theta_range,
+            integrated=True
+        )
+
+    def systematics(self, years=None, theta_range=None) -> Systematics:
+        """ Pre-computes the response of the expected counts to the detector
+        systematics. See Systematics for details
+
+        Parameters
+        ----------
+        years: list
+            The years to fold for. Defaults to all years
+        theta_range: list
+            The [min, max) range of the injected theta angles to integrate over
+            in degrees. Defaults to all angles
+
+        Returns
+        -------
+        response: Systematics
+            The pre-computed response
+        """
+        return Systematics(self, years=years, theta_range=theta_range)
+
+    def seasonal(self, flavor="numu", years=None, theta_range=None) -> Seasonal:
+        """ Sets up the seasonal prediction of the atmospheric counts.
+        See Seasonal for details
+
+        Parameters
+        ----------
+        flavor: str
+            The neutrino flavor, "numu" or "nue"
+        years: list
+            The years to fold for. Defaults to all years
+        theta_range: list
+            The [min, max) range of the injected theta angles to integrate over
+            in degrees. Defaults to all angles
+
+        Returns
+        -------
+        seasonal: Seasonal
+            The seasonal prediction
+        """
+        return Seasonal(self, flavor=flavor, years=years, theta_range=theta_range)
+
+    def unfolding(self, dec_bands=(-90., 90.), years=None) -> Unfolding:
+        """ Sets up the unfolding of reconstructed energy spectra.
+        See Unfolding for details
+
+        Parameters
+        ----------
+        dec_bands: list
+            The edges of the declination bands in degrees
+        years: list
+            The years to use. Defaults to all years
+
+        Returns
+        -------
+        unfolding: Unfolding
+            The unfolding object
+        """
+        return Unfolding(self, dec_bands=dec_bands, years=years)
+
+    def unbinned(self, years=None) -> UnbinnedLikelihood:
+        """ Sets up the per-event PDFs for unbinned likelihoods.
+        See UnbinnedLikelihood for details
+
+        Parameters
+        ----------
+        years: list
+            The years to use. Defaults to all years
+
+        Returns
+        -------
+        unbinned: UnbinnedLikelihood
+            The per-event PDFs
+        """
+        return UnbinnedLikelihood(self, years=years)
 
     def close(self):
         """ Wraps up the program
@@ -139,12 +566,15 @@ class Fledgeling(object):
         _log.info('---------------------------------------------------')
         _log.info('---------------------------------------------------')
         # A new simulation
-        if config["general"]["enable logging"]:
+        if self._config["general"]["enable logging"]:
             _log.debug(
                 "Dumping run settings into %s",
-                config["general"]["config location"],
+                self._config["general"]["config location"],
             )
-            with open(config["general"]["config location"], "w") as f:
-                yaml.dump(config, f)
-        # Closing log
-        logging.shutdown()
+            settings = self._config.to_dict()
+            settings.pop("runtime")
+            with open(self._config["general"]["config location"], "w") as f:
+                yaml.dump(settings, f)
+        # The handlers are shared with other objects and only flushed
+        for handler in _log.handlers:
+            handler.flush()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# Name: fluxes.py
+# Authors: Stephan Meighen-Berger
+# Registry of flux models with cached evaluations
+
+import logging
+import threading
+from collections import OrderedDict
+from functools import partial
+import numpy as np
+
+
+_log = logging.getLogger(__name__)
+# The registered models, name: function
+_registry = {}
+
+
+def register(name: str):
+    """ Decorator adding a flux model to the registry. The model is called with the
+    energies in GeV and its parameters as keyword arguments. It needs to broadcast
+    the parameters against each other and return the differential flux in
+    1/(GeV cm^2 s sr) with shape (parameter shape..., len(energies))
+
+    Parameters
+    ----------
+    name: str
+        The name of the model
+
+    Returns
+    -------
+    wrapper: function
+        The decorator
+    """
+    def wrapper(func):
+        _registry[name] = func
+        return func
+    return wrapper
+
+
+def available_models() -> list:
+    """ The names of the registered models
+    """
+    return list(_registry.keys())
+
+
+def _params(*params) -> list:
+    """ Broadcasts the parameters against each other and adds the energy axis
+    """
+    return [
+        param[..., np.newaxis]
+        for param in np.broadcast_arrays(*[np.asarray(p, dtype=float) for p in params])
+    ]
+
+
+@register("power law")
+def power_law(energies: np.array, norm=1.66e-18, index=2.53, e0=1e5) -> np.array:
+    """ A single power law. The defaults are the IceCube astrophysical best fit
+
+    Parameters
+    ----------
+    energies: np.array
+        The energies in GeV
+    norm: float or np.array
+        The flux at e0 in 1/(GeV cm^2 s sr)
+    index: float or np.array
+        The spectral index
+    e0: float or np.array
+        The pivot energy in GeV
+
+    Returns
+    -------
+    flux: np.array
+        The differential flux
+    """
+    norm, index, e0 = _params(norm, index, e0)
+    return norm * (energies / e0)**-index
+
+
+@register("broken power law")
+def broken_power_law(
+        energies: np.array,
+        norm=1.66e-18,
+        index1=2.53,
+        index2=3.,
+        ebreak=1e6,
+        e0=1e5) -> np.array:
+    """ A power law changing its index at the break energy
+
+    Parameters
+    ----------
+    energies: np.array
+        The energies in GeV
+    norm: float or np.array
+        The flux at e0 in 1/(GeV cm^2 s sr)
+    index1: float or np.array
+        The spectral index below the break
+    index2: float or np.array
+        The spectral index above the break
+    ebreak: float or np.array
+        The break energy in GeV
+    e0: float or np.array
+        The pivot energy in GeV. Needs to be below the break
+
+    Returns
+    -------
+    flux: np.array
+        The differential flux
+    """
+    norm, index1, index2, ebreak, e0 = _params(norm, index1, index2, ebreak, e0)
+    at_break = norm * (ebreak / e0)**-index1
+    return np.where(
+        energies < ebreak,
+        norm * (energies / e0)**-index1,
+        at_break * (energies / ebreak)**-index2
+    )
+
+
+@register("cutoff")
+def cutoff_power_law(
+        energies: np.array,
+        norm=1.66e-18,
+        index=2.53,
+        ecut=1e7,
+        e0=1e5) -> np.array:
+    """ A power law with an exponential cutoff
+
+    Parameters
+    ----------
+    energies: np.array
+        The energies in GeV
+    norm: float or np.array
+        The flux at e0 (without the cutoff) in 1/(GeV cm^2 s sr)
+    index: float or np.array
+        The spectral index
+    ecut: float or np.array
+        The cutoff energy in GeV
+    e0: float or np.array
+        The pivot energy in GeV
+
+    Returns
+    -------
+    flux: np.array
+        The differential flux
+    """
+    norm, index, ecut, e0 = _params(norm, index, ecut, e0)
+    return norm * (energies / e0)**-index * np.exp(-energies / ecut)
+
+
+class FluxModels(object):
+    """ Evaluates the registered flux models on the energy grid of a fledgeling object.
+    Evaluations are stored in an LRU cache keyed by the model, parameters and grid.
+    The returned arrays are read-only, since they are shared between calls.
+    Additionally the atmospheric fluxes "atmospheric numu" and "atmospheric nue" are
+    available. These are given on the theta and energy grids, i.e. with shape
+    (parameter shape..., len(thetas), len(egrid)), and only have a norm parameter
+
+    Parameters
+    ----------
+    fledge: Fledgeling
+        The fledgeling object providing the grids and atmospherics
+    """
+    def __init__(self, fledge):
+        self._fledge = fledge
+        self._maxsize = fledge.config["advanced"]["flux cache size"]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def models(self):
+        """ The available models
+        """
+        return available_models() + ["atmospheric numu", "atmospheric nue"]
+
+    def _atmospheric(self, flavor: str, energies: np.array, norm=1.) -> np.array:
+        """ The atmospheric flux averaged over the energy bins
+        """
+        norm, = _params(norm)
+        binned = self._fledge.atmos.binned[flavor] / self._fledge.ewidths
+        return norm[..., np.newaxis] * binned
+
+    def evaluate(self, name: str, energies=None, **params) -> np.array:
+        """ Evaluates a model. All parameters can be arrays and are broadcast
+        against each other
+
+        Parameters
+        ----------
+        name: str
+            The name of the model
+        energies: np.array
+            The energies in GeV. Defaults to the energy grid
+        params: dict
+            The parameters of the model. Missing ones use the model's defaults
+
+        Returns
+        -------
+        flux: np.array
+            The differential flux in 1/(GeV cm^2 s sr) with shape
+            (parameter shape..., len(energies))
+
+        Raises
+        ------
+        ValueError
+            Unknown model or atmospheric fluxes requested on another grid
+        """
+        if energies is None:
+            energies = self._fledge.egrid
+        energies = np.asarray(energies, dtype=float)
+        if name in ["atmospheric numu", "atmospheric nue"]:
+            if not np.array_equal(energies, self._fledge.egrid):
+                raise ValueError("The atmospheric fluxes are only available on the energy grid")
+            model = partial(self._atmospheric, name.split()[1])
+        elif name in _registry:
+            model = _registry[name]
+        else:
+            raise ValueError(
+                "Unknown flux model %s! Available are %s" % (name, ", ".join(self.models))
+            )
+        key = (name, energies.tobytes()) + tuple(
+            (param, np.shape(value), np.asarray(value, dtype=float).tobytes())
+            for param, value in sorted(params.items())
+        )
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        flux = model(energies, **params)
+        flux.setflags(write=False)
+        with self._lock:
+            self._cache[key] = flux
+            if len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+        return flux
+
+    def clear(self):
+        """ Empties the cache
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Name: seasonal.py
+# Authors: Stephan Meighen-Berger
+# Time-dependent atmospheric prediction following the seasons
+
+import logging
+import numpy as np
+from .atmospherics import Atmos
+from .utils import theta_mask, theta_weights
+
+
+_log = logging.getLogger(__name__)
+
+
+class Seasonal(object):
+    """ Seasonal prediction of the atmospheric counts. The atmospheric fluxes are
+    computed (or loaded) once for each month. Their folded rates are then weighted
+    with the livetime each year had in the month. All months and years are folded
+    in one pass
+
+    Parameters
+    ----------
+    fledge: Fledgeling
+        The fledgeling object providing the tables and grids
+    flavor: str
+        The neutrino flavor, "numu" or "nue"
+    years: list
+        The years to fold for. Defaults to all years
+    theta_range: list
+        The [min, max) range of the injected theta angles to integrate over
+        in degrees. Defaults to all angles
+
+    Raises
+    ------
+    ValueError
+        The atmospheric model can not vary by month or not all months are set
+    """
+    def __init__(self, fledge, flavor="numu", years=None, theta_range=None):
+        config = fledge.config
+        dr = fledge.dr
+        if years is None:
+            years = list(dr.conversion_tables.keys())
+        self._years = list(years)
+        atmospherics = config["atmospherics"]
+        if atmospherics["name"] == "analytic" or (
+                atmospherics["name"] == "hkkm" and
+                atmospherics["hkkm model"]["seasonal table"] is None):
+            raise ValueError(
+                "The %s atmospherics do not vary by month! " % atmospherics["name"] +
+                "Use mceq or set the hkkm seasonal table"
+            )
+        self._months = list(config["atmospherics"]["months"])
+        if len(self._months) != 12:
+            raise ValueError("The seasonal prediction needs all 12 months! Check the config file")
+        fluxes = []
+        for month in self._months:
+            _log.info("Loading the atmospheric fluxes of %s" % month)
+            fluxes.append(Atmos(fledge.ebins, fledge.thetas, config, month=month).binned[flavor])
+        thetas = fledge.thetas
+        mask = theta_mask(thetas, theta_range)
+        # Same integration over the thetas as in Fledgeling.fold
+        weights = theta_weights(thetas, mask)
+        tables = np.array([dr.conversion_tables[year][mask] for year in self._years])
+        _log.info("Folding %d months and %d years" % (len(self._months), len(self._years)))
+        # Same normalization as in Fledgeling.fold
+        self._rates = np.einsum(
+            "t,mte,yter->ymr",
+            weights, np.array(fluxes)[:, mask], tables, optimize=True
+        ) / 100
+        self._livetimes = np.array([dr.monthly_livetimes[year] for year in self._years])
+
+    @property
+    def years(self):
+        """ The years of the counts
+        """
+        return self._years
+
+    @property
+    def months(self):
+        """ The months of the counts
+        """
+        return self._months
+
+    @property
+    def livetimes(self):
+        """ The livetimes in seconds with shape (len(years), 12)
+        """
+        return self._livetimes
+
+    @property
+    def rates(self):
+        """ The expected rates in 1/s with shape (len(years), 12, len(egrid))
+        """
+        return self._rates
+
+    def counts(self, resolved=False) -> np.array:
+        """ The expected counts weighted with the livetimes of the months
+
+        Parameters
+        ----------
+        resolved: bool
+            Keep the months separate
+
+        Returns
+        -------
+        counts: np.array
+            The expected counts with shape (len(years), 12, len(egrid)) if resolved,
+            else summed over the months with shape (len(years), len(egrid))
+        """
+        counts = self._rates * self._livetimes[..., None]
+        if resolved:
+            return counts
+        return np.sum(counts, axis=1)
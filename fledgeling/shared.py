@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Name: shared.py
+# Authors: Stephan Meighen-Berger
+# Shares loaded tables between processes on one node
+
+import json
+import logging
+import os
+import threading
+from functools import lru_cache
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from .utils import ColumnarTable
+
+
+_log = logging.getLogger(__name__)
+# Alignment of the arrays in the shared block in bytes
+_ALIGNMENT = 64
+_attach_lock = threading.Lock()
+
+
+class TableServer(object):
+    """ Publishes the data of a loaded Fledgeling object into one shared memory
+    block and writes a small json manifest describing it. Fledgeling objects in
+    other processes attach to it by setting advanced.shared tables to the manifest
+    location. The block is removed when the server is closed
+
+    Parameters
+    ----------
+    fledge: Fledgeling
+        The loaded fledgeling object
+    manifest: str
+        Location of the manifest file
+    """
+    def __init__(self, fledge, manifest: str):
+        dr = fledge.dr
+        cascade = fledge.atmos.cascade
+        years = list(dr.conversion_tables.keys())
+        zeniths = list(cascade.keys())
+        arrays = {
+            "conversion tables": np.array([dr.conversion_tables[year] for year in years]),
+            "monthly livetimes": np.array([dr.monthly_livetimes[year] for year in years]),
+        }
+        for key in ["e grid", "e width", "e bin", "numu", "nue"]:
+            arrays["cascade/" + key] = np.array([cascade[zen][key] for zen in zeniths])
+        tables = {}
+        for name, table in [
+                ("aeff", dr._aeff_dic),
+                ("events", dr._event_dic),
+                ("smearing", dr._smearing_dic)]:
+            tables[name] = {
+                "segments": {
+                    str(key): list(table.segments[key]) for key in table.keys()
+                },
+                "columns": table.columns,
+                "edges": list(table.edges.keys()),
+            }
+            for column in table.columns:
+                arrays["%s/columns/%s" % (name, column)] = table.codes(column)
+            for column, edges in table.edges.items():
+                arrays["%s/edges/%s" % (name, column)] = edges
+        # Placing the arrays into one block
+        layout = {}
+        size = 0
+        for name, arr in arrays.items():
+            size = -(-size // _ALIGNMENT) * _ALIGNMENT
+            layout[name] = {
+                "offset": size, "shape": list(arr.shape), "dtype": arr.dtype.str
+            }
+            size += arr.nbytes
+        _log.info("Publishing %.1f MB of tables" % (size / 1e6))
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, arr in arrays.items():
+            np.ndarray(
+                arr.shape, dtype=arr.dtype, buffer=self._shm.buf,
+                offset=layout[name]["offset"]
+            )[...] = arr
+        self._manifest = manifest
+        tmp_file = manifest + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({
+                "block": self._shm.name,
+                "arrays": layout,
+                "years": years,
+                "zeniths": zeniths,
+                "livetimes": {str(year): dr.livetimes[year] for year in dr.livetimes.keys()},
+                "tables": tables,
+            }, f)
+        # Workers never see a partially written manifest
+        os.replace(tmp_file, manifest)
+
+    @property
+    def manifest(self):
+        """ Location of the manifest
+        """
+        return self._manifest
+
+    def close(self):
+        """ Removes the shared block and the manifest. Attached workers keep their
+        mappings until they exit
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        if os.path.exists(self._manifest):
+            os.remove(self._manifest)
+        if os.name == "posix":
+            # Workers sharing this process' resource tracker drop its registration
+            # when attaching (see _open_block). Unlinking expects it
+            resource_tracker.register(self._shm._name, "shared_memory")
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _open_block(name: str) -> shared_memory.SharedMemory:
+    """ Opens an existing shared memory block without taking ownership of it
+
+    Parameters
+    ----------
+    name: str
+        The name of the block
+
+    Returns
+    -------
+    shm: shared_memory.SharedMemory
+        The block
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before python 3.13 the block is always tracked (on posix) and would be
+        # removed when the worker exits. The registration is undone instead
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+@lru_cache(maxsize=None)
+def _attach(manifest: str) -> dict:
+    """ Cached implementation of attach
+    """
+    with open(manifest) as f:
+        description = json.load(f)
+    shm = _open_block(description["block"])
+    arrays = {}
+    for name, layout in description["arrays"].items():
+        arrays[name] = np.ndarray(
+            layout["shape"], dtype=np.dtype(layout["dtype"]), buffer=shm.buf,
+            offset=layout["offset"]
+        )
+        arrays[name].setflags(write=False)
+    years = description["years"]
+    zeniths = description["zeniths"]
+    shared = {
+        # Keeping the block alive as long as the arrays are used
+        "block": shm,
+        "conversion tables": {
+            year: arrays["conversion tables"][i] for i, year in enumerate(years)
+        },
+        "livetimes": {
+            int(year): livetime for year, livetime in description["livetimes"].items()
+        },
+        "monthly livetimes": {
+            year: arrays["monthly livetimes"][i] for i, year in enumerate(years)
+        },
+        "cascade": {
+            zen: {
+                key: arrays["cascade/" + key][i]
+                for key in ["e grid", "e width", "e bin", "numu", "nue"]
+            }
+            for i, zen in enumerate(zeniths)
+        },
+    }
+    for name, table in description["tables"].items():
+        shared[name] = ColumnarTable(
+            {
+                column: arrays["%s/columns/%s" % (name, column)]
+                for column in table["columns"]
+            },
+            {
+                column: arrays["%s/edges/%s" % (name, column)]
+                for column in table["edges"]
+            },
+            {
+                int(key): tuple(segment) for key, segment in table["segments"].items()
+            }
+        )
+    return shared
+
+
+def attach(manifest: str) -> dict:
+    """ Attaches to tables published by a TableServer. The arrays are read-only
+    zero-copy views of the shared block. Each process only attaches once per manifest
+
+    Parameters
+    ----------
+    manifest: str
+        Location of the manifest file
+
+    Returns
+    -------
+    shared: dict
+        The "conversion tables", "livetimes", "monthly livetimes", atmospheric "cascade" and the
+        "aeff", "events" and "smearing" tables
+    """
+    with _attach_lock:
+        return _attach(manifest)
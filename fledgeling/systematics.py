@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Name: systematics.py
+# Authors: Stephan Meighen-Berger
+# Pre-computed detector systematics response
+
+import logging
+import numpy as np
+from .utils import theta_mask, theta_weights
+
+
+_log = logging.getLogger(__name__)
+
+
+def resample(tables: np.array, positions: np.array) -> np.array:
+    """ Linearly resamples the tables along the last (reconstructed energy) axis.
+    Values outside of the grid are zero
+
+    Parameters
+    ----------
+    tables: np.array
+        The tables to resample. The last axis is the reconstructed energy
+    positions: np.array
+        The positions to evaluate at in units of grid indices. Needs to be
+        broadcastable to the tables
+
+    Returns
+    -------
+    resampled: np.array
+        The resampled tables
+    """
+    positions = np.broadcast_to(positions, tables.shape)
+    n = tables.shape[-1]
+    low = np.floor(positions).astype(int)
+    frac = positions - low
+    # Padding with zeros for the out of range values
+    padded = np.concatenate([tables, np.zeros(tables.shape[:-1] + (1,))], axis=-1)
+    def fetch(idx):
+        idx = np.where((idx >= 0) & (idx < n), idx, n)
+        return np.take_along_axis(padded, idx, axis=-1)
+    return (1. - frac) * fetch(low) + frac * fetch(low + 1)
+
+
+def energy_scale(tables: np.array, unigrid: np.array, shift: float) -> np.array:
+    """ Shifts the reconstructed energies of the tables
+
+    Parameters
+    ----------
+    tables: np.array
+        The conversion tables. The last axis is the reconstructed energy
+    unigrid: np.array
+        The (equidistant) reconstructed energy grid as log10(E/GeV)
+    shift: float
+        The shift in log10(E/GeV)
+
+    Returns
+    -------
+    shifted: np.array
+        The shifted tables
+    """
+    step = unigrid[1] - unigrid[0]
+    return resample(tables, np.arange(len(unigrid)) - shift / step)
+
+
+def smearing_width(tables: np.array, unigrid: np.array, width: float) -> np.array:
+    """ Scales the width of the smearing around the mean reconstructed energy of
+    each injected energy and angle. The total counts are conserved
+
+    Parameters
+    ----------
+    tables: np.array
+        The conversion tables. The last axis is the reconstructed energy
+    unigrid: np.array
+        The (equidistant) reconstructed energy grid as log10(E/GeV)
+    width: float
+        The relative width. 1 is the nominal smearing
+
+    Returns
+    -------
+    smeared: np.array
+        The tables with the new smearing widths
+    """
+    idx = np.arange(len(unigrid))
+    norm = np.sum(tables, axis=-1, keepdims=True)
+    mean = np.divide(
+        np.sum(tables * idx, axis=-1, keepdims=True), norm,
+        out=np.zeros_like(norm), where=norm > 0.
+    )
+    smeared = resample(tables, mean + (idx - mean) / width) / width
+    # Restoring the normalization lost to the grid edges
+    new_norm = np.sum(smeared, axis=-1, keepdims=True)
+    return smeared * np.divide(
+        norm, new_norm, out=np.zeros_like(norm), where=new_norm > 0.
+    )
+
+
+class Systematics(object):
+    """ Pre-computed response of the expected counts to detector systematics.
+    The conversion tables are modified and integrated over the thetas once for
+    each point of the nuisance grids defined in the config. They are stored with
+    shape (len(years), len(grid), len(egrid), len(egrid)) and include the
+    livetimes. Afterwards the counts for any flux and nuisance values are a single
+    einsum over the tables, using a piecewise linear (additive) interpolation
+    between the grid points. Outside of the grids the closest grid edge is used.
+    The effective area scale is applied exactly.
+    Since the thetas are integrated out, the fluxes can not depend on the angle
+
+    Parameters
+    ----------
+    fledge: Fledgeling
+        The fledgeling object providing the tables and grids
+    years: list
+        The years to fold for. Defaults to all years
+    theta_range: list
+        The [min, max) range of the injected theta angles to integrate over
+        in degrees. Defaults to all angles
+    """
+    def __init__(self, fledge, years=None, theta_range=None):
+        dr = fledge.dr
+        if years is None:
+            years = list(dr.conversion_tables.keys())
+        self._years = list(years)
+        self._ewidths = fledge.ewidths
+        self._unigrid = np.log10(fledge.egrid)
+        thetas = fledge.thetas
+        mask = theta_mask(thetas, theta_range)
+        # Same integration and normalization as in Fledgeling.fold
+        weights = theta_weights(thetas, mask) / 100
+        tables = [dr.conversion_tables[year][mask] for year in self._years]
+        livetimes = np.array([dr.livetimes[year] for year in self._years])
+        def integrate(tables):
+            return np.array([
+                np.einsum("t,ter->er", weights, table) * livetime
+                for table, livetime in zip(tables, livetimes)
+            ])
+        self._nominal = integrate(tables)
+        morphs = {
+            "energy scale": energy_scale,
+            "smearing width": smearing_width,
+        }
+        self._grids = {}
+        responses = [self._nominal[:, np.newaxis]]
+        for name, morph in morphs.items():
+            grid_def = fledge.config["systematics"][name]
+            self._grids[name] = np.linspace(grid_def[0], grid_def[1], grid_def[2])
+            _log.info("Pre-computing the %s response" % name)
+            response = np.array([
+                integrate([morph(table, self._unigrid, value) for table in tables])
+                for value in self._grids[name]
+            ])
+            # Stored as the difference to the nominal tables
+            responses.append(np.swapaxes(response, 0, 1) - self._nominal[:, np.newaxis])
+        # The nominal tables followed by the responses along the grid axis
+        self._tables = np.concatenate(responses, axis=1)
+
+    @property
+    def years(self):
+        """ The years of the counts
+        """
+        return self._years
+
+    @property
+    def grids(self):
+        """ The nuisance grids the response was computed on
+        """
+        return self._grids
+
+    @property
+    def tables(self):
+        """ The theta-integrated nominal tables followed by the responses at the
+        grid points with shape (len(years), 1 + grid points, len(egrid), len(egrid))
+        """
+        return self._tables
+
+    def _grid_weights(self, name: str, value: np.array) -> np.array:
+        """ The linear interpolation weights of the grid points
+        """
+        grid = self._grids[name]
+        idx = np.clip(np.searchsorted(grid, value) - 1, 0, len(grid) - 2)
+        frac = np.clip((value - grid[idx]) / (grid[idx + 1] - grid[idx]), 0., 1.)
+        points = np.arange(len(grid))
+        return (
+            (1. - frac)[..., None] * (points == idx[..., None]) +
+            frac[..., None] * (points == idx[..., None] + 1)
+        )
+
+    def expected_counts(
+            self,
+            flux: np.array,
+            energy_scale=0.,
+            smearing_width=1.,
+            aeff_scale=1.,
+            integrated=False) -> np.array:
+        """ Evaluates the expected counts for a flux and the nuisance parameters.
+        The flux and parameters can be arrays and are broadcast against each other.
+        Energy scales and smearing widths outside of the grids are clamped to them
+
+        Parameters
+        ----------
+        flux: np.array
+            The differential flux evaluated on the energy grid in 1/(GeV cm^2 s sr)
+            with shape (..., len(egrid))
+        energy_scale: float or np.array
+            Shift of the reconstructed energy in log10(E/GeV)
+        smearing_width: float or np.array
+            The relative width of the smearing
+        aeff_scale: float or np.array
+            The scale of the effective area
+        integrated: bool
+            If the flux is already integrated over the energy bins in 1/(cm^2 s sr)
+
+        Returns
+        -------
+        counts: np.array
+            The expected counts with shape (..., len(years), len(egrid)), where
+            ... is the broadcast shape of the flux and parameters
+        """
+        flux = np.asarray(flux, dtype=float)
+        if not integrated:
+            flux = flux * self._ewidths
+        energy_scale, smearing_width, aeff_scale = np.broadcast_arrays(
+            *[np.asarray(param, dtype=float) for param in
+              [energy_scale, smearing_width, aeff_scale]]
+        )
+        weights = np.concatenate([
+            np.ones(energy_scale.shape + (1,)),
+            self._grid_weights("energy scale", energy_scale),
+            self._grid_weights("smearing width", smearing_width),
+        ], axis=-1)
+        counts = np.einsum(
+            "...g,...e,yger->...yr", weights, flux, self._tables, optimize=True
+        )
+        return np.clip(counts, 0., None) * aeff_scale[..., None, None]
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Name: unbinned.py
+# Authors: Stephan Meighen-Berger
+# Per-event signal and background PDFs for unbinned likelihoods
+
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+_log = logging.getLogger(__name__)
+# Floor of the per-event likelihoods, avoiding log(0) for events outside of both PDFs
+_PDF_FLOOR = np.finfo(float).tiny
+
+
+def _cell(values: np.array, grid: np.array) -> tuple:
+    """ The lower grid point and interpolation fraction of each value on an
+    equidistant grid. Values outside of the grid use the closest grid point
+
+    Parameters
+    ----------
+    values: np.array
+        The values
+    grid: np.array
+        The equidistant grid
+
+    Returns
+    -------
+    low: np.array
+        Index of the lower grid point
+    frac: np.array
+        The distance to the lower grid point in units of the step
+    """
+    pos = np.clip((values - grid[0]) / (grid[1] - grid[0]), 0., len(grid) - 1.)
+    low = np.minimum(np.floor(pos).astype(np.intp), len(grid) - 2)
+    return low, pos - low
+
+
+class UnbinnedLikelihood(object):
+    """ Per-event PDFs in declination and reconstructed energy for unbinned
+    likelihoods. The PDFs of a flux hypothesis are built from the conversion tables
+    for each year and normalized over declination and log10(E_rec/GeV). The grid
+    positions and interpolation weights of all events are computed once, afterwards
+    the per-event PDF values of a hypothesis are a single gather with bilinear
+    interpolation. They are cached for each hypothesis. The background are the
+    atmospheric muon neutrinos.
+    Note the conversion tables have no reconstructed angle axis, so the declination
+    axis of the PDFs is the injected one (thetas - 90). The reconstructed event
+    declinations are evaluated on it, i.e. the angular resolution is neglected.
+    The angular tables only provide the PSF and angular error, not the
+    reconstructed declination
+
+    Parameters
+    ----------
+    fledge: Fledgeling
+        The fledgeling object providing the tables, grids and events
+    years: list
+        The years to use. Defaults to all years
+    """
+    def __init__(self, fledge, years=None):
+        config = fledge.config
+        self._dr = fledge.dr
+        if years is None:
+            years = list(self._dr.conversion_tables.keys())
+        self._years = list(years)
+        self._ewidths = fledge.ewidths
+        self._ntheta = len(fledge.thetas)
+        # The PDF grids. Declinations are converted from the thetas
+        self._dec_grid = fledge.thetas - 90.
+        self._log_egrid = np.log10(fledge.egrid)
+        self._cell_size = (
+            (self._dec_grid[1] - self._dec_grid[0]) *
+            (self._log_egrid[1] - self._log_egrid[0])
+        )
+        _log.info("Locating the events on the PDF grids")
+        decs = []
+        energies = []
+        event_years = []
+        for i, year in enumerate(self._years):
+            events = self._dr._event_dic.year(year)
+            decs.append(events["dec"])
+            energies.append(events["E"])
+            event_years.append(np.full(len(events), i))
+        self._event_years = np.concatenate(event_years)
+        dec_low, dec_frac = _cell(np.concatenate(decs), self._dec_grid)
+        e_low, e_frac = _cell(np.concatenate(energies), self._log_egrid)
+        # Flat indices and bilinear weights of the four surrounding grid points
+        n_e = len(self._log_egrid)
+        corner = (self._event_years * self._ntheta + dec_low) * n_e + e_low
+        self._indices = corner + np.array([0, 1, n_e, n_e + 1])[:, np.newaxis]
+        self._weights = np.array([
+            (1. - dec_frac) * (1. - e_frac),
+            (1. - dec_frac) * e_frac,
+            dec_frac * (1. - e_frac),
+            dec_frac * e_frac,
+        ])
+        self._maxsize = config["advanced"]["event cache size"]
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._background = self.event_pdf(fledge.atmos.binned["numu"], integrated=True)
+
+    @property
+    def years(self):
+        """ The years used
+        """
+        return self._years
+
+    @property
+    def event_years(self):
+        """ The year of each event (as index into years)
+        """
+        return self._event_years
+
+    @property
+    def background(self):
+        """ The background PDF value of each event
+        """
+        return self._background
+
+    def pdf(self, flux: np.array, integrated=False) -> np.array:
+        """ Builds the normalized PDFs of a flux
+
+        Parameters
+        ----------
+        flux: np.array
+            The differential flux evaluated on the energy grid in 1/(GeV cm^2 s sr).
+            Either of shape (len(egrid),) or (len(thetas), len(egrid))
+        integrated: bool
+            If the flux is already integrated over the energy bins in 1/(cm^2 s sr)
+
+        Returns
+        -------
+        pdf: np.array
+            The PDFs in 1/(deg log10(GeV)) with shape (len(years), len(thetas), len(egrid)).
+            The axes are year, declination and reconstructed energy
+        """
+        if not integrated:
+            flux = flux * self._ewidths
+        weights = np.broadcast_to(flux, (self._ntheta, len(self._ewidths)))
+        rates = np.array([
+            np.einsum("te,ter->tr", weights, self._dr.conversion_tables[year])
+            for year in self._years
+        ])
+        norm = np.sum(rates, axis=(1, 2), keepdims=True) * self._cell_size
+        return np.divide(rates, norm, out=np.zeros_like(rates), where=norm > 0.)
+
+    def event_pdf(self, flux: np.array, integrated=False) -> np.array:
+        """ Evaluates the PDFs of a flux for all events. The results are cached
+
+        Parameters
+        ----------
+        flux: np.array
+            The differential flux evaluated on the energy grid in 1/(GeV cm^2 s sr).
+            Either of shape (len(egrid),) or (len(thetas), len(egrid))
+        integrated: bool
+            If the flux is already integrated over the energy bins in 1/(cm^2 s sr)
+
+        Returns
+        -------
+        values: np.array
+            The (read-only) PDF value of each event
+        """
+        flux = np.asarray(flux, dtype=float)
+        key = (flux.shape, flux.tobytes(), integrated)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        pdf = self.pdf(flux, integrated=integrated).ravel()
+        values = np.einsum(
+            "cn,cn->n", self._weights, pdf[self._indices]
+        )
+        values.setflags(write=False)
+        with self._lock:
+            self._cache[key] = values
+            if len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+        return values
+
+    def log_likelihood(self, n_signal, flux: np.array, integrated=False) -> np.array:
+        """ The log-likelihood of the events for a mixture of signal and background
+
+        Parameters
+        ----------
+        n_signal: float or np.array
+            The number of signal events. Can be an array to scan
+        flux: np.array
+            The signal flux evaluated on the energy grid in 1/(GeV cm^2 s sr).
+            Either of shape (len(egrid),) or (len(thetas), len(egrid))
+        integrated: bool
+            If the flux is already integrated over the energy bins in 1/(cm^2 s sr)
+
+        Returns
+        -------
+        llh: np.array
+            The log-likelihood with the shape of n_signal. Events where the
+            signal and background PDFs vanish contribute log(_PDF_FLOOR)
+        """
+        signal = self.event_pdf(flux, integrated=integrated)
+        fraction = np.asarray(n_signal, dtype=float)[..., np.newaxis] / len(signal)
+        likelihood = fraction * signal + (1. - fraction) * self._background
+        return np.sum(np.log(np.maximum(likelihood, _PDF_FLOOR)), axis=-1)
+
+    def clear(self):
+        """ Empties the cache
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# Name: unfolding.py
+# Authors: Stephan Meighen-Berger
+# Spectrum unfolding using the conversion tables as the response
+
+import logging
+import numpy as np
+from .utils import theta_weights
+
+
+_log = logging.getLogger(__name__)
+
+
+def _curvature(x: np.array) -> np.array:
+    """ Applies L^T L to x, with L the second difference operator along the last axis
+
+    Parameters
+    ----------
+    x: np.array
+        The values
+
+    Returns
+    -------
+    curvature: np.array
+        L^T L x
+    """
+    diff2 = x[..., 2:] - 2. * x[..., 1:-1] + x[..., :-2]
+    curvature = np.zeros_like(x)
+    curvature[..., :-2] += diff2
+    curvature[..., 1:-1] -= 2. * diff2
+    curvature[..., 2:] += diff2
+    return curvature
+
+
+class Unfolding(object):
+    """ Unfolds reconstructed energy spectra to neutrino fluxes. The conversion tables
+    and livetimes are reduced to one (injected energy x reconstructed energy) response
+    per year and declination band. The full response is never formed, instead it is
+    applied per block. All methods are vectorized over any leading dimensions of the
+    counts, e.g. bootstrap samples
+
+    Parameters
+    ----------
+    fledge: Fledgeling
+        The fledgeling object providing the tables and grids
+    dec_bands: list
+        The edges of the declination bands in degrees
+    years: list
+        The years to use. Defaults to all years
+    """
+    def __init__(self, fledge, dec_bands=(-90., 90.), years=None):
+        self._config = fledge.config
+        self._dr = fledge.dr
+        self._dec_bands = np.array(dec_bands, dtype=float)
+        if years is None:
+            years = list(self._dr.conversion_tables.keys())
+        self._years = list(years)
+        self._egrid = fledge.egrid
+        # The reconstructed energy bin edges, the grid points are their centers
+        log_egrid = np.log10(fledge.egrid)
+        step = log_egrid[1] - log_egrid[0]
+        self._log_ebins = np.append(log_egrid - step / 2., log_egrid[-1] + step / 2.)
+        # Declinations are converted to thetas
+        thetas = fledge.thetas
+        # The bands share the weights of the full grid, so they add up to the full sky
+        weights = theta_weights(thetas)
+        _log.info("Building the response")
+        response = []
+        for year in self._years:
+            tables = self._dr.conversion_tables[year]
+            year_response = []
+            for dec_min, dec_max in zip(self._dec_bands[:-1], self._dec_bands[1:]):
+                theta_mask = (thetas >= dec_min + 90.) & (thetas < dec_max + 90.)
+                # Integrated over the band as in Fledgeling.fold
+                year_response.append(
+                    np.einsum("t,ter->er", weights[theta_mask], tables[theta_mask])
+                )
+            response.append(year_response)
+        # Same normalization as in Fledgeling.fold
+        livetimes = np.array([self._dr.livetimes[year] for year in self._years])
+        self._response = (
+            np.array(response) * fledge.ewidths[:, None] *
+            livetimes[:, None, None, None] / 100
+        )
+        # Sensitivity of each flux bin to the data
+        self._sensitivity = self.adjoint(np.ones(self._response.shape[:2] + (len(log_egrid),)))
+
+    @property
+    def response(self):
+        """ The response with shape (len(years), len(dec_bands) - 1, len(egrid), len(egrid)).
+        The axes are year, declination band, injected energy and reconstructed energy
+        """
+        return self._response
+
+    @property
+    def years(self):
+        """ The years used
+        """
+        return self._years
+
+    def forward(self, flux: np.array) -> np.array:
+        """ Folds fluxes into expected counts
+
+        Parameters
+        ----------
+        flux: np.array
+            The differential fluxes in 1/(GeV cm^2 s sr) with shape
+            (..., len(dec_bands) - 1, len(egrid))
+
+        Returns
+        -------
+        counts: np.array
+            The expected counts with shape (..., len(years), len(dec_bands) - 1, len(egrid))
+        """
+        return np.einsum("...be,yber->...ybr", flux, self._response)
+
+    def adjoint(self, counts: np.array) -> np.array:
+        """ Applies the transposed response to counts
+
+        Parameters
+        ----------
+        counts: np.array
+            Counts with shape (..., len(years), len(dec_bands) - 1, len(egrid))
+
+        Returns
+        -------
+        flux_space: np.array
+            The result with shape (..., len(dec_bands) - 1, len(egrid))
+        """
+        return np.einsum("...ybr,yber->...be", counts, self._response)
+
+    def event_counts(self) -> np.array:
+        """ Histograms the measured events in declination bands and reconstructed energy
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        counts: np.array
+            The counts with shape (len(years), len(dec_bands) - 1, len(egrid))
+        """
+        counts = []
+        for year in self._years:
+            events = self._dr._event_dic.year(year)
+            year_counts, _, _ = np.histogram2d(
+                events["dec"], events["E"], bins=[self._dec_bands, self._log_ebins]
+            )
+            counts.append(year_counts)
+        return np.array(counts)
+
+    def _initial(self, counts: np.array, prior: np.array) -> np.array:
+        """ Scales the prior flux to the total counts of each band
+
+        Parameters
+        ----------
+        counts: np.array
+            The counts with shape (..., len(years), len(dec_bands) - 1, len(egrid))
+        prior: np.array
+            The prior flux. Defaults to E^-3.7
+
+        Returns
+        -------
+        initial: np.array
+            The scaled prior with shape (..., len(dec_bands) - 1, len(egrid))
+        """
+        if prior is None:
+            prior = self._egrid**-3.7
+        prior = np.broadcast_to(prior, self._sensitivity.shape)
+        expected = np.sum(self.forward(prior), axis=(-3, -1))
+        measured = np.sum(counts, axis=(-3, -1))
+        scale = np.divide(
+            measured, expected, out=np.zeros_like(measured, dtype=float),
+            where=expected > 0.
+        )
+        return prior * scale[..., None]
+
+    def richardson_lucy(
+            self,
+            counts: np.array,
+            iterations=100,
+            prior=None) -> np.array:
+        """ Richardson-Lucy (Poisson maximum likelihood EM) unfolding
+
+        Parameters
+        ----------
+        counts: np.array
+            The counts with shape (..., len(years), len(dec_bands) - 1, len(egrid))
+        iterations: int
+            Number of iterations. Fewer iterations regularize more
+        prior: np.array
+            The starting flux shape. Defaults to E^-3.7
+
+        Returns
+        -------
+        flux: np.array
+            The unfolded fluxes with shape (..., len(dec_bands) - 1, len(egrid))
+        """
+        flux = self._initial(counts, prior)
+        for _ in range(iterations):
+            expected = self.forward(flux)
+            ratio = np.divide(
+                counts, expected, out=np.zeros_like(expected), where=expected > 0.
+            )
+            flux = flux * np.divide(
+                self.adjoint(ratio), self._sensitivity,
+                out=np.zeros_like(flux), where=self._sensitivity > 0.
+            )
+        return flux
+
+    def least_squares(
+            self,
+            counts: np.array,
+            regularization=1.,
+            iterations=200,
+            prior=None) -> np.array:
+        """ Tikhonov regularized weighted least squares unfolding. The flux is
+        parametrized relative to the prior and its curvature is penalized.
+        The normal equations are solved with the conjugate gradient method
+
+        Parameters
+        ----------
+        counts: np.array
+            The counts with shape (..., len(years), len(dec_bands) - 1, len(egrid))
+        regularization: float
+            Strength of the curvature penalty relative to the data
+        iterations: int
+            Maximum number of conjugate gradient iterations
+        prior: np.array
+            The reference flux shape. Defaults to E^-3.7
+
+        Returns
+        -------
+        flux: np.array
+            The unfolded (non-negative) fluxes with shape (..., len(dec_bands) - 1, len(egrid))
+        """
+        reference = self._initial(counts, prior)
+        # Poisson variance estimate
+        weights = 1. / np.maximum(counts, 1.)
+        rhs = self.adjoint(weights * counts) * reference
+        # The penalty is relative to the typical data term (x is close to 1)
+        strength = regularization * np.mean(np.abs(rhs), axis=-1, keepdims=True)
+        def normal(x):
+            return (
+                self.adjoint(weights * self.forward(reference * x)) * reference +
+                strength * _curvature(x)
+            )
+        # Batched conjugate gradient
+        x = np.ones_like(reference)
+        residual = rhs - normal(x)
+        direction = residual.copy()
+        res_norm = np.sum(residual**2, axis=-1, keepdims=True)
+        for _ in range(iterations):
+            tmp = normal(direction)
+            denom = np.sum(direction * tmp, axis=-1, keepdims=True)
+            alpha = np.divide(
+                res_norm, denom, out=np.zeros_like(res_norm), where=denom > 0.
+            )
+            x = x + alpha * direction
+            residual = residual - alpha * tmp
+            new_norm = np.sum(residual**2, axis=-1, keepdims=True)
+            if np.all(new_norm <= 1e-20 * np.sum(rhs**2, axis=-1, keepdims=True)):
+                break
+            beta = np.divide(
+                new_norm, res_norm, out=np.zeros_like(res_norm), where=res_norm > 0.
+            )
+            direction = residual + beta * direction
+            res_norm = new_norm
+        return np.clip(reference * x, 0., None)
+
+    def unfold(
+            self,
+            counts=None,
+            method="richardson lucy",
+            bootstrap=0,
+            **kwargs) -> dict:
+        """ Unfolds the counts and optionally estimates the errors using
+        Poisson resampled counts. All samples are unfolded in one batch
+
+        Parameters
+        ----------
+        counts: np.array
+            The counts with shape (len(years), len(dec_bands) - 1, len(egrid)).
+            Defaults to the measured events
+        method: str
+            "richardson lucy" or "least squares"
+        bootstrap: int
+            Number of bootstrap samples. 0 disables the error estimation
+        kwargs: dict
+            Passed on to the unfolding method
+
+        Returns
+        -------
+        result: dict
+            "flux" the unfolded fluxes with shape (len(dec_bands) - 1, len(egrid)),
+            and if bootstrapped the "error" (standard deviation) and all "samples"
+
+        Raises
+        ------
+        ValueError
+            Unknown unfolding method
+        """
+        if method == "richardson lucy":
+            unfolder = self.richardson_lucy
+        elif method == "least squares":
+            unfolder = self.least_squares
+        else:
+            raise ValueError("Unknown unfolding method! Use richardson lucy or least squares")
+        if counts is None:
+            counts = self.event_counts()
+        result = {"flux": unfolder(counts, **kwargs)}
+        if bootstrap > 0:
+            _log.info("Unfolding %d bootstrap samples" % bootstrap)
+            rstate = self._config["runtime"]["random state"]
+            samples = rstate.poisson(counts, size=(bootstrap,) + counts.shape)
+            result["samples"] = unfolder(samples.astype(float), **kwargs)
+            result["error"] = np.std(result["samples"], axis=0)
+        return result
@@ -5,10 +5,15 @@
 
 # imports
 import csv
+import pkgutil
 from typing import Dict
 import numpy as np
 import pandas as pd
 
+# np.trapz was renamed in numpy 2.0 and removed later
+trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
 def ice_parser(filename: str) -> np.array:
     """ loads IceCube data and parses it in a useful fashion.
     Note depending on the type of data the output shape may be different.
@@ -34,8 +39,258 @@ def ice_parser(filename: str) -> np.array:
     store = np.array(store, dtype=float)
     return store
 
-def dataframe_from2d(dic: Dict, column_names: list, new_col_name: str) -> pd.DataFrame:
-    """ Converts a 2d dictionary to a combined dataframe
+
+def read_stored(location: str, dump: str) -> bytes:
+    """ Reads a stored table. Tables are written to the conversion dump, so it is
+    searched first. Tables shipped with the package are the fallback
+
+    Parameters
+    ----------
+    location: str
+        The table location relative to the conversion dump and the package
+    dump: str
+        The conversion dump
+
+    Returns
+    -------
+    data: bytes
+        The stored table
+
+    Raises
+    ------
+    FileNotFoundError
+        The table is stored in neither location
+    """
+    try:
+        with open(dump + location, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return pkgutil.get_data(__package__, location)
+
+
+def theta_mask(thetas: np.array, theta_range=None) -> np.array:
+    """ Mask of the thetas within [min, max)
+
+    Parameters
+    ----------
+    thetas: np.array
+        The theta grid in degrees
+    theta_range: list
+        The [min, max) range in degrees. All thetas if None
+
+    Returns
+    -------
+    mask: np.array
+        The boolean mask
+    """
+    if theta_range is None:
+        return np.ones(len(thetas), dtype=bool)
+    return (thetas >= theta_range[0]) & (thetas < theta_range[1])
+
+
+def theta_weights(thetas: np.array, mask=None) -> np.array:
+    """ Trapezoidal integration weights of the theta grid in degrees. Ranges use the
+    weights of the full grid, so the integrals of adjacent ranges add up to the
+    integral over the full grid
+
+    Parameters
+    ----------
+    thetas: np.array
+        The theta grid in degrees
+    mask: np.array
+        Boolean mask of the thetas to return the weights for. Defaults to all
+
+    Returns
+    -------
+    weights: np.array
+        The weights of the (selected) thetas
+    """
+    steps = np.diff(thetas)
+    weights = np.zeros(len(thetas))
+    weights[:-1] += steps / 2.
+    weights[1:] += steps / 2.
+    if mask is None:
+        return weights
+    return weights[mask]
+
+
+class ColumnarTable(object):
+    """ Compact column store for tables split by an integer key (usually the year).
+    All keys share one buffer per column, with each key pointing to a row segment.
+    Keys pointing to identical data share the same segment.
+
+    Parameters
+    ----------
+    columns: Dict
+        Dictionary of 1d numpy arrays, one per column. Bin columns contain
+        indices into their respective edges
+    edges: Dict
+        Dictionary of the edge values for each bin column
+    segments: Dict
+        Dictionary of (start, stop) row offsets for each key
+    """
+    def __init__(self, columns: Dict, edges: Dict, segments: Dict):
+        self._columns = columns
+        self._edges = edges
+        self._segments = segments
+
+    def __getitem__(self, name: str) -> np.array:
+        """ Fetches the (decoded) values of a column
+
+        Parameters
+        ----------
+        name: str
+            The column name
+
+        Returns
+        -------
+        values: np.array
+            The column values. Bin columns are decoded to their edge values
+        """
+        if name in self._edges:
+            return self._edges[name][self._columns[name]]
+        return self._columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __len__(self) -> int:
+        return len(next(iter(self._columns.values())))
+
+    @property
+    def columns(self) -> list:
+        """ The column names
+        """
+        return list(self._columns.keys())
+
+    @property
+    def edges(self) -> Dict:
+        """ The edges of the bin columns
+        """
+        return self._edges
+
+    @property
+    def segments(self) -> Dict:
+        """ The (start, stop) rows of each key
+        """
+        return self._segments
+
+    @property
+    def nbytes(self) -> int:
+        """ Memory used by the stored data in bytes
+        """
+        return (
+            sum(col.nbytes for col in self._columns.values()) +
+            sum(edge.nbytes for edge in self._edges.values())
+        )
+
+    def keys(self) -> list:
+        """ The keys (years) stored in the table
+        """
+        return list(self._segments.keys())
+
+    def codes(self, name: str) -> np.array:
+        """ The raw stored values of a column. For bin columns these are the edge indices
+
+        Parameters
+        ----------
+        name: str
+            The column name
+
+        Returns
+        -------
+        codes: np.array
+            The stored values
+        """
+        return self._columns[name]
+
+    def set_read_only(self) -> None:
+        """ Marks the stored data as read-only, e.g. when it is shared
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        for col in self._columns.values():
+            col.setflags(write=False)
+        for edge in self._edges.values():
+            edge.setflags(write=False)
+
+    def year(self, key: int) -> "ColumnarTable":
+        """ Zero-copy view of the rows belonging to a single key
+
+        Parameters
+        ----------
+        key: int
+            The key (year) of interest
+
+        Returns
+        -------
+        view: ColumnarTable
+            Table containing only the rows of the key. The data is not copied
+        """
+        start, stop = self._segments[key]
+        return ColumnarTable(
+            {name: col[start:stop] for name, col in self._columns.items()},
+            self._edges,
+            {key: (0, stop - start)}
+        )
+
+    def select(self, mask: np.array) -> "ColumnarTable":
+        """ Selects rows using a boolean mask. Note this copies the data
+
+        Parameters
+        ----------
+        mask: np.array
+            Boolean mask of the rows to keep
+
+        Returns
+        -------
+        selection: ColumnarTable
+            Table containing only the selected rows
+        """
+        segments = {}
+        for key, (start, stop) in self._segments.items():
+            offset = np.count_nonzero(mask[:start])
+            segments[key] = (offset, offset + np.count_nonzero(mask[start:stop]))
+        return ColumnarTable(
+            {name: col[mask] for name, col in self._columns.items()},
+            self._edges,
+            segments
+        )
+
+    def to_dataframe(self, key_name="year") -> pd.DataFrame:
+        """ Converts the table to a pandas dataframe. Mostly for interactive use
+
+        Parameters
+        ----------
+        key_name: str
+            Name of the column containing the key
+
+        Returns
+        -------
+        df: pd.DataFrame
+            Dataframe with all decoded columns and the keys
+        """
+        dfs = []
+        for key in self.keys():
+            view = self.year(key)
+            tmp = pd.DataFrame({name: view[name] for name in view.columns})
+            tmp[key_name] = key
+            dfs.append(tmp)
+        return pd.concat(dfs, ignore_index=True)
+
+
+def columnar_from2d(
+        dic: Dict,
+        column_names: list,
+        bin_columns=(),
+        dtypes=None) -> ColumnarTable:
+    """ Converts a 2d dictionary to a compact columnar table
 
     Parameters
     ----------
@@ -43,21 +298,47 @@ def dataframe_from2d(dic: Dict, column_names: list, new_col_name: str) -> pd.Dat
         A dictionary whose elements are 2d numpy arrays
     column_names: list
         Names of the columns of the 2d arrays
-    new_col_name: str
-        Name of the new column containing the original dictionary key
+    bin_columns: list
+        Columns containing bin edges. These are stored as indices into
+        their unique values
+    dtypes: Dict
+        Optional dtypes for specific columns. The rest is stored as float32,
+        while the edges of bin columns are kept as float64
+
     Returns
     -------
-    df: pd.DataFrame
-        Dataframe object containing the data with an addional column for the original
-        dictionary index
+    table: ColumnarTable
+        The table with each dictionary key pointing to its own rows. Keys
+        sharing the same array only store it once
     """
-    dfs = []
+    if dtypes is None:
+        dtypes = {}
+    # Identical arrays are only stored once
+    unique = []
+    segments = {}
+    start = 0
     for key in dic.keys():
-        tmp = pd.DataFrame(
-            dic[key],
-            columns=column_names
-        )
-        tmp[new_col_name] = key
-        dfs.append(tmp)
-    return pd.concat(dfs)
-        
\ No newline at end of file
+        for prev_key, arr in unique:
+            if arr is dic[key]:
+                segments[key] = segments[prev_key]
+                break
+        else:
+            unique.append((key, dic[key]))
+            segments[key] = (start, start + len(dic[key]))
+            start += len(dic[key])
+    data = np.concatenate([arr for _, arr in unique], axis=0)
+    columns = {}
+    edges = {}
+    for i, name in enumerate(column_names):
+        if name in bin_columns:
+            edges[name], codes = np.unique(data[:, i], return_inverse=True)
+            # The edges are few, so they keep their full precision
+            edges[name] = edges[name].astype(dtypes.get(name, np.float64))
+            # The smallest unsigned type holding all indices
+            codes_type = np.min_scalar_type(len(edges[name]) - 1)
+            columns[name] = codes.reshape(-1).astype(codes_type)
+        else:
+            columns[name] = np.ascontiguousarray(
+                data[:, i], dtype=dtypes.get(name, np.float32)
+            )
+    return ColumnarTable(columns, edges, segments)
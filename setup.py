@@ -24,7 +24,6 @@ setup(
         "numpy",
         "scipy",
         "pandas",
-        "mceq",
         "tqdm",
         "pyarrow"
     ],
@@ -33,6 +32,9 @@ setup(
         "custom": ["mceq"]
     },
     packages=["fledgeling"],
+    entry_points={
+        "console_scripts": ["fledgeling=fledgeling.__main__:main"]
+    },
     package_data={'fledgeling': ["data/*.pkl"]},
     include_package_data=True
 )
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Name: conftest.py
+# Authors: Stephan Meighen-Berger
+# Synthetic IceCube data and fledgeling objects shared by the tests
+
+import os
+import pickle as pkl
+import numpy as np
+import pytest
+from fledgeling import Fledgeling
+from fledgeling.config import config
+
+# MJD of 2008-01-01
+_START = 54466.
+
+
+def _write(path: str, rows) -> None:
+    """ Writes a table in the format of the IceCube data release
+    """
+    np.savetxt(path, rows, fmt="%.6g", header="header")
+
+
+def _make_data(root: str) -> None:
+    """ Writes a small synthetic data set with the layout of the IceCube 10 year
+    point source release. The smearing is gaussian in log10(E) and uses the
+    20 PSF and 22 angular error bins of the release
+    """
+    rng = np.random.default_rng(1337)
+    for folder in ["irfs", "events", "uptime"]:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    energies, decs = np.meshgrid(np.arange(2., 9., 0.1), np.arange(-90., 90., 30.), indexing="ij")
+    energies, decs = energies.ravel(), decs.ravel()
+    aeff = np.column_stack([
+        energies, energies + 0.1, decs, decs + 30.,
+        10**(energies - 2.) * (1.5 + np.sin(np.radians(decs)))
+    ])
+    for name in set(config["icecube data"]["effective areas"]):
+        _write(root + name, aeff)
+    psf = np.linspace(0., 40., 21)
+    angerr = np.linspace(0., 22., 23)
+    e, dec, e_rec, p, a = np.meshgrid(
+        np.arange(2., 9., 1.), np.arange(3), np.arange(1., 9., 0.4),
+        np.arange(20), np.arange(22), indexing="ij"
+    )
+    e, dec, e_rec, p, a = [arr.ravel() for arr in [e, dec, e_rec, p, a]]
+    dec_edges = np.array([-90., -10., 10., 90.])
+    weight = np.exp(-0.5 * ((e_rec + 0.2 - e - 0.5) / 0.5)**2)
+    smearing = np.column_stack([
+        e, e + 1., dec_edges[dec], dec_edges[dec + 1], e_rec, e_rec + 0.4,
+        psf[p], psf[p + 1], angerr[a], angerr[a + 1],
+        weight * rng.uniform(0., 1., len(e)) / 440.
+    ])
+    for name in set(config["icecube data"]["smearing matrix"]):
+        _write(root + name, smearing)
+    for i, (events, uptime) in enumerate(zip(
+            config["icecube data"]["event data"], config["icecube data"]["uptime"])):
+        start = _START + 365. * i
+        n_events = 300
+        _write(root + events, np.column_stack([
+            np.sort(rng.uniform(start, start + 365., n_events)),
+            rng.uniform(2., 6., n_events),
+            rng.uniform(0.2, 5., n_events),
+            rng.uniform(0., 360., n_events),
+            np.degrees(np.arcsin(rng.uniform(-1., 1., n_events))),
+            rng.uniform(0., 360., n_events),
+            rng.uniform(0., 180., n_events),
+        ]))
+        days = np.arange(start, start + 365.)
+        _write(root + uptime, np.column_stack([days, days + 0.9]))
+
+
+def _hkkm_flux(energies: np.array, cos_zenith: np.array) -> np.array:
+    """ The numu flux of the synthetic HKKM tables in 1/(GeV m^2 s sr)
+    """
+    return (1. + cos_zenith) * energies**-3.7
+
+
+def _write_hkkm(path: str, scale=1.) -> None:
+    """ Writes a synthetic table in the HKKM format. The nue flux is a twentieth of
+    the numu flux and the anti-neutrinos equal the neutrinos
+    """
+    energies = np.logspace(-1., 4., 101)
+    with open(path, "w") as f:
+        for high in np.arange(1., -1., -0.1):
+            f.write(" average flux in [cosZ =%5.2f -- %5.2f, phi_Az =   0 -- 360]\n" % (
+                high, high - 0.1
+            ))
+            f.write(" Enu(GeV)   NuMu       NuMubar    NuE        NuEbar\n")
+            flux = scale * _hkkm_flux(energies, high - 0.05)
+            for row in zip(energies, flux, flux, flux / 20., flux / 20.):
+                f.write(" %.6E %.6E %.6E %.6E %.6E\n" % row)
+
+
+@pytest.fixture(scope="session")
+def hkkm_tables(tmp_path_factory):
+    """ The synthetic HKKM table and the pattern of the seasonal ones.
+    Each month is scaled by 1 + month index / 10
+    """
+    root = tmp_path_factory.mktemp("hkkm")
+    table = str(root / "hkkm.d")
+    _write_hkkm(table)
+    for i, month in enumerate(config["atmospherics"]["months"]):
+        _write_hkkm(str(root / ("hkkm_%s.d" % month)), 1. + i / 10.)
+    return table, str(root / "hkkm_%s.d")
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory):
+    """ Folder containing the synthetic data set
+    """
+    root = str(tmp_path_factory.mktemp("icecube"))
+    _make_data(root)
+    return root
+
+
+@pytest.fixture(scope="session")
+def userconfig(data_dir, tmp_path_factory):
+    """ Config on a coarse theta grid using the synthetic data and analytic
+    atmospherics. The tables are generated, nothing is stored
+    """
+    dump = str(tmp_path_factory.mktemp("dump"))
+    os.makedirs(os.path.join(dump, "data"))
+    return {
+        "experimental data": {"filepath": data_dir, "pre-computed": False},
+        "atmospherics": {"name": "analytic"},
+        "advanced": {"thetas": [0., 180., 10.], "conversion dump": dump + os.sep},
+    }
+
+
+@pytest.fixture(scope="session")
+def fledge(userconfig):
+    """ Loaded fledgeling object shared by the tests
+    """
+    return Fledgeling(userconfig)
+
+
+@pytest.fixture(scope="session")
+def stored_userconfig(fledge, userconfig, tmp_path_factory):
+    """ The test config loading the conversion tables of fledge from its dump
+    """
+    dump = str(tmp_path_factory.mktemp("stored"))
+    os.makedirs(os.path.join(dump, "data"))
+    with open(os.path.join(dump, "data", "icecube_standard.pkl"), "wb") as f:
+        pkl.dump(dict(fledge.dr.conversion_tables), f)
+    return dict(
+        userconfig,
+        **{
+            "experimental data": dict(userconfig["experimental data"], **{"pre-computed": True}),
+            "advanced": dict(userconfig["advanced"], **{"conversion dump": dump + os.sep}),
+        }
+    )
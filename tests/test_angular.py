@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Name: test_angular.py
+# Authors: Stephan Meighen-Berger
+# Tests of the angular conversion tables
+
+import os
+import numpy as np
+import pytest
+from fledgeling import Fledgeling
+
+_YEARS = [4, 5]
+_RANGE = [90., 180.]
+
+
+@pytest.fixture(scope="module")
+def angular(stored_userconfig):
+    """ Object with angular tables, loading the conversion tables of fledge
+    """
+    return Fledgeling(dict(stored_userconfig, **{"angular tables": {"enabled": True}}))
+
+
+def test_disabled(fledge):
+    assert fledge.angular is None
+
+
+def test_stored(angular):
+    path = angular.config["advanced"]["conversion dump"] + angular.config["angular tables"]["storage"]
+    assert os.path.isfile(path)
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_marginal_matches_fold(angular):
+    flux = 1e-8 * angular.egrid**-2.
+    folded = angular.fold(flux, years=_YEARS, theta_range=_RANGE)
+    both = angular.fold_angular(flux, years=_YEARS, theta_range=_RANGE)
+    shape = (len(angular.egrid), len(angular.angular.psf_bins) - 1, len(angular.angular.angerr_bins) - 1)
+    for year in _YEARS:
+        assert both[year].shape == shape
+        np.testing.assert_allclose(both[year].sum(axis=(1, 2)), folded[year], rtol=1e-6)
+
+
+def test_marginalized_axes(angular):
+    flux = 1e-8 * angular.egrid**-2.
+    both = angular.fold_angular(flux, years=[4], theta_range=_RANGE)[4]
+    psf = angular.fold_angular(flux, keep=("psf",), years=[4], theta_range=_RANGE)[4]
+    angerr = angular.fold_angular(flux, keep=("angerr",), years=[4], theta_range=_RANGE)[4]
+    np.testing.assert_allclose(psf, both.sum(axis=2), rtol=1e-6)
+    np.testing.assert_allclose(angerr, both.sum(axis=1), rtol=1e-6)
+
+
+def test_table(angular):
+    mask = angular._theta_mask([100., 130.])
+    table = angular.angular.table(4, theta_mask=mask, keep=("angerr",))
+    np.testing.assert_allclose(
+        table.sum(axis=-1), angular.dr.conversion_tables[4][mask], rtol=1e-6
+    )
+
+
+def test_unknown_axis(angular):
+    with pytest.raises(ValueError):
+        angular.fold_angular(angular.egrid**-2., keep=("ra",), years=[4])
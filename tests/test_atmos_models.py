@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Name: test_atmos_models.py
+# Authors: Stephan Meighen-Berger
+# Tests of the tabulated and analytic atmospheric fluxes
+
+import numpy as np
+import pytest
+from fledgeling import atmospherics
+from fledgeling.atmos_models import (
+    cascade_from_fluxes, conventional_flux, effective_cos, interpolate_table, read_hkkm
+)
+from fledgeling.config import config
+
+
+def hkkm_flux(energies: np.array, cos_zenith: np.array) -> np.array:
+    """ The numu flux of the synthetic HKKM tables (see conftest.py) in 1/(GeV m^2 s sr)
+    """
+    return (1. + cos_zenith) * energies**-3.7
+
+
+def test_read_hkkm(hkkm_tables):
+    cos_grid, energies, fluxes = read_hkkm(hkkm_tables[0])
+    assert np.all(np.diff(cos_grid) > 0.)
+    np.testing.assert_allclose(cos_grid[[0, -1]], [-0.95, 0.95])
+    assert fluxes["numu"].shape == (20, len(energies))
+    # Converted to 1/(GeV cm^2 s sr)
+    np.testing.assert_allclose(
+        fluxes["numu"], hkkm_flux(energies[None, :], cos_grid[:, None]) / 1e4, rtol=1e-5
+    )
+    np.testing.assert_allclose(fluxes["antinue"], fluxes["numu"] / 20., rtol=1e-6)
+    assert not fluxes["nue"].flags.writeable
+
+
+def test_read_hkkm_energies_differ(tmp_path):
+    path = str(tmp_path / "broken.d")
+    with open(path, "w") as f:
+        for high, energies in [(1., [1., 10.]), (0.9, [1., 20.])]:
+            f.write(" average flux in [cosZ =%5.2f -- %5.2f, phi_Az =   0 -- 360]\n" % (high, high - 0.1))
+            for energy in energies:
+                f.write(" %.4E 1.0 1.0 1.0 1.0\n" % energy)
+    with pytest.raises(ValueError):
+        read_hkkm(path)
+
+
+def test_interpolation_at_the_nodes(hkkm_tables):
+    cos_grid, energies, fluxes = read_hkkm(hkkm_tables[0])
+    interpolated = interpolate_table(cos_grid, energies, fluxes["numu"], energies, cos_grid)
+    np.testing.assert_allclose(interpolated, fluxes["numu"], rtol=1e-12)
+
+
+def test_interpolation_between_and_beyond(hkkm_tables):
+    cos_grid, energies, fluxes = read_hkkm(hkkm_tables[0])
+    # A power law is exact in log-log, also when extrapolated
+    test_energies = np.array([3.3e-2, 1.7, 5e3, 1e6])
+    interpolated = interpolate_table(
+        cos_grid, energies, fluxes["numu"], test_energies, cos_grid[[3]]
+    )
+    np.testing.assert_allclose(
+        interpolated[0], hkkm_flux(test_energies, cos_grid[3]) / 1e4, rtol=1e-4
+    )
+    # Beyond the cos(zenith) range the closest bin is used
+    np.testing.assert_allclose(
+        interpolate_table(cos_grid, energies, fluxes["numu"], test_energies, [1.]),
+        interpolate_table(cos_grid, energies, fluxes["numu"], test_energies, [cos_grid[-1]])
+    )
+
+
+def test_effective_cos():
+    np.testing.assert_allclose(effective_cos(np.array([1.])), 1.)
+    cos_eff = effective_cos(np.array([0., 0.1, 0.5]))
+    assert np.all(cos_eff > [0., 0.1, 0.5])
+    assert np.all(np.diff(cos_eff) > 0.)
+
+
+def test_conventional_flux():
+    params = dict(config["atmospherics"]["analytic model"]["numu"])
+    params.update({key: config["atmospherics"]["analytic model"][key] for key in ["norm", "index", "Z_NN"]})
+    energies = np.array([1e-2, 1e6])
+    flux = conventional_flux(energies, np.array([1., 0.]), params)
+    assert flux.shape == (2, 2)
+    # Below the critical energies the mesons decay before interacting
+    low = params["norm"] * energies[0]**-params["index"] / (1. - params["Z_NN"]) * (
+        params["A_pi"] + params["A_K"]
+    )
+    np.testing.assert_allclose(flux[:, 0], low, rtol=1e-3)
+    # At high energies the horizontal flux is larger
+    assert flux[1, 1] > flux[0, 1]
+
+
+def test_cascade_from_fluxes():
+    ebins = np.logspace(2., 4., 5)
+    numu = np.ones((2, 4))
+    cascade = cascade_from_fluxes(ebins, [0, 60], numu, 2. * numu)
+    assert list(cascade.keys()) == [0, 60]
+    np.testing.assert_allclose(cascade[60]["e width"], np.diff(ebins))
+    np.testing.assert_allclose(cascade[60]["e grid"], np.sqrt(ebins[1:] * ebins[:-1]))
+    np.testing.assert_allclose(cascade[0]["nue"], 2.)
+
+
+def test_hkkm_backend(stored_userconfig, hkkm_tables):
+    # On a cos(zenith) node of the table and beyond it
+    node = np.degrees(np.arccos(0.55))
+    conf = config.merged(dict(stored_userconfig, atmospherics={
+        "name": "hkkm", "hkkm model": {"table": hkkm_tables[0], "zeniths": [0., node]}
+    })).freeze()
+    ebins = np.logspace(2., 4., 21)
+    atmos = atmospherics.Atmos(ebins, np.arange(0., 180., 10.), conf)
+    egrid = np.sqrt(ebins[1:] * ebins[:-1])
+    # Particles and anti-particles are summed
+    np.testing.assert_allclose(
+        atmos.cascade[node]["numu"], 2. * hkkm_flux(egrid, 0.55) / 1e4, rtol=1e-5
+    )
+    np.testing.assert_allclose(
+        atmos.cascade[0.]["nue"], 2. * hkkm_flux(egrid, 0.95) / 20. / 1e4, rtol=1e-5
+    )
+
+
+def test_hkkm_backend_needs_a_table(stored_userconfig):
+    conf = config.merged(dict(stored_userconfig, atmospherics={"name": "hkkm"})).freeze()
+    with pytest.raises(ValueError):
+        atmospherics.Atmos(np.logspace(2., 4., 21), np.arange(0., 180., 10.), conf)
+
+
+def test_mceq_missing(stored_userconfig, tmp_path, monkeypatch):
+    monkeypatch.setattr(atmospherics, "MCEqRun", None)
+    conf = config.merged(dict(stored_userconfig, atmospherics={
+        "name": "mceq", "pre-computed": False
+    })).freeze()
+    with pytest.raises(ImportError):
+        atmospherics.Atmos(np.logspace(2., 4., 21), np.arange(0., 180., 10.), conf)
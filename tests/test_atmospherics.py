@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Name: test_atmospherics.py
+# Authors: Stephan Meighen-Berger
+# Tests of the projection of the atmospheric fluxes
+
+import numpy as np
+
+
+def test_projection_onto_the_simulation_bins(fledge):
+    atmos = fledge.atmos
+    sim_bins = atmos._sim_bins()
+    np.testing.assert_allclose(atmos.projection(sim_bins), np.diag(np.diff(sim_bins)))
+
+
+def test_projection_conserves_the_integral(fledge):
+    atmos = fledge.atmos
+    sim_bins = atmos._sim_bins()
+    flux = atmos.cascade[0]["numu"]
+    integral = np.sum(flux * np.diff(sim_bins))
+    # Coarser bins covering the same range, and finer bins with shifted edges
+    for ebins in [sim_bins[::5], np.logspace(np.log10(sim_bins[0]), np.log10(sim_bins[-1]), 213)]:
+        projected = atmos.projection(ebins) @ flux
+        np.testing.assert_allclose(np.sum(projected), integral)
+    # Bins beyond the simulation get nothing
+    outside = np.array([sim_bins[-1], 2. * sim_bins[-1], 3. * sim_bins[-1]])
+    assert np.all(atmos.projection(outside) @ flux == 0.)
+
+
+def test_projection_cached(fledge):
+    atmos = fledge.atmos
+    assert atmos.projection(fledge.ebins) is atmos.projection(fledge.ebins)
+
+
+def test_project_thetas(fledge):
+    atmos = fledge.atmos
+    widths = np.diff(atmos._sim_bins())
+    zeniths = sorted(atmos.cascade.keys())
+    thetas = np.array([zeniths[2], 180. - zeniths[2], (zeniths[2] + zeniths[3]) / 2.])
+    binned = atmos.project(atmos._sim_bins(), thetas)["numu"]
+    # Simulated zeniths are used directly, up-going thetas mirror them
+    np.testing.assert_allclose(binned[0], atmos.cascade[zeniths[2]]["numu"] * widths)
+    np.testing.assert_allclose(binned[1], binned[0])
+    # Linear in between
+    np.testing.assert_allclose(
+        binned[2],
+        (atmos.cascade[zeniths[2]]["numu"] + atmos.cascade[zeniths[3]]["numu"]) / 2. * widths
+    )
+
+
+def test_binned_on_the_grids(fledge):
+    binned = fledge.atmos.binned
+    assert binned["numu"].shape == (len(fledge.thetas), len(fledge.egrid))
+    projected = fledge.atmos.project(fledge.ebins, fledge.thetas)
+    np.testing.assert_allclose(binned["nue"], projected["nue"])
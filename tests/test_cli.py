@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Name: test_cli.py
+# Authors: Stephan Meighen-Berger
+# Tests of the command line interface
+
+import argparse
+import copy
+import os
+import numpy as np
+import pytest
+import yaml
+from fledgeling import Fledgeling
+from fledgeling.__main__ import _override, _setup_config, main
+from fledgeling.config import config
+from fledgeling.utils import read_stored
+
+
+@pytest.fixture
+def global_config():
+    """ The global config, restored after the test
+    """
+    saved = copy.deepcopy(dict(config))
+    yield config
+    config.clear()
+    config.update(saved)
+
+
+@pytest.fixture
+def config_file(userconfig, tmp_path):
+    """ The test config as yaml file
+    """
+    path = str(tmp_path / "config.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(userconfig, f)
+    return path
+
+
+def test_override(global_config):
+    _override("advanced.thetas=[0., 90., 5]")
+    _override("experimental data.filepath=/data")
+    assert global_config["advanced"]["thetas"] == [0., 90., 5]
+    assert global_config["experimental data"]["filepath"] == "/data"
+
+
+@pytest.mark.parametrize("jobs, expected", [(None, 3), (2, 2)])
+def test_jobs_only_overridden_when_passed(global_config, jobs, expected):
+    _setup_config(argparse.Namespace(config=None, set=["advanced.jobs=3"], jobs=jobs))
+    assert global_config["advanced"]["jobs"] == expected
+
+
+def test_read_stored(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "Notice.txt").write_bytes(b"dump")
+    assert read_stored("data/Notice.txt", str(tmp_path) + os.sep) == b"dump"
+    # Falls back to the package
+    assert read_stored("data/Notice.txt", str(tmp_path / "missing") + os.sep) != b"dump"
+    with pytest.raises(FileNotFoundError):
+        read_stored("data/missing.pkl", str(tmp_path) + os.sep)
+
+
+def test_build_loads_from_output(global_config, config_file, userconfig, fledge, tmp_path):
+    output = str(tmp_path / "tables")
+    main(["build", "--tables", "conversion", "--output", output, "--config", config_file])
+    assert os.path.isfile(os.path.join(output, "data", "icecube_standard.pkl"))
+    loaded = Fledgeling(dict(
+        userconfig,
+        **{
+            "experimental data": dict(userconfig["experimental data"], **{"pre-computed": True}),
+            "advanced": dict(userconfig["advanced"], **{"conversion dump": output + os.sep}),
+        }
+    ))
+    for year, table in fledge.dr.conversion_tables.items():
+        np.testing.assert_allclose(loaded.dr.conversion_tables[year], table)
+
+
+def test_fold(global_config, config_file, fledge, tmp_path):
+    flux_file = str(tmp_path / "flux.txt")
+    energies = np.logspace(1., 10., 50)
+    np.savetxt(flux_file, np.column_stack([energies, 1e-8 * energies**-2.]))
+    main([
+        "fold", flux_file, "--config", config_file, "--years", "3", "4",
+        "--thetas", "90", "180", "--output", str(tmp_path)
+    ])
+    counts = np.load(str(tmp_path / "flux_counts.npz"))
+    expected = fledge.fold(1e-8 * fledge.egrid**-2., years=[3, 4], theta_range=[90., 180.])
+    np.testing.assert_allclose(counts["year_3"], expected[3], rtol=1e-6)
+    np.testing.assert_allclose(counts["total"], expected[3] + expected[4], rtol=1e-6)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Name: test_config.py
+# Authors: Stephan Meighen-Berger
+# Tests of the config snapshots
+
+import logging
+import pickle
+import pytest
+import yaml
+from fledgeling.config import config, FrozenConfig
+from fledgeling.fledgeling import _handlers, _log, _setup_logging
+
+
+def test_merged_keeps_the_global_config():
+    thetas = config["advanced"]["thetas"]
+    merged = config.merged({"advanced": {"thetas": [0., 90., 5]}})
+    assert merged["advanced"]["thetas"] == [0., 90., 5]
+    assert merged["advanced"]["ebins"] == config["advanced"]["ebins"]
+    assert config["advanced"]["thetas"] == thetas
+
+
+def test_snapshot_is_immutable():
+    snapshot = config.freeze()
+    assert isinstance(snapshot["advanced"], FrozenConfig)
+    assert isinstance(snapshot["advanced"]["thetas"], tuple)
+    with pytest.raises(TypeError):
+        snapshot["general"] = {}
+    with pytest.raises(TypeError):
+        snapshot["advanced"]["jobs"] = 2
+    with pytest.raises(TypeError):
+        snapshot["advanced"].update({"jobs": 2})
+
+
+def test_snapshot_is_independent():
+    merged = config.merged()
+    snapshot = merged.freeze()
+    merged["advanced"]["years"] = 3
+    assert snapshot["advanced"]["years"] == config["advanced"]["years"]
+
+
+def test_to_dict_round_trip():
+    snapshot = config.freeze()
+    dumped = yaml.safe_dump(snapshot.to_dict())
+    assert FrozenConfig(yaml.safe_load(dumped)) == snapshot
+    assert isinstance(snapshot.to_dict()["advanced"]["thetas"], list)
+
+
+def test_pickle():
+    snapshot = config.freeze()
+    assert pickle.loads(pickle.dumps(snapshot)) == snapshot
+
+
+def test_object_snapshot(fledge, userconfig):
+    assert isinstance(fledge.config, FrozenConfig)
+    assert fledge.config["advanced"]["thetas"] == tuple(userconfig["advanced"]["thetas"])
+    assert config["advanced"]["thetas"] != userconfig["advanced"]["thetas"]
+
+
+def test_log_handlers_shared():
+    quiet = config.freeze()
+    verbose = config.merged({"general": {"debug level": logging.WARNING}}).freeze()
+    _setup_logging(quiet)
+    handlers = len(_log.handlers)
+    console = _handlers["console"]
+    level = console.level
+    try:
+        _setup_logging(verbose)
+        _setup_logging(quiet)
+        assert len(_log.handlers) == handlers
+        # The most verbose level requested is kept
+        assert console.level == min(level, logging.WARNING)
+    finally:
+        console.setLevel(level)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Name: test_fledgeling.py
+# Authors: Stephan Meighen-Berger
+# Tests of the main interface
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from fledgeling import Fledgeling
+from fledgeling.utils import theta_mask, theta_weights, trapezoid
+
+
+def test_theta_weights():
+    thetas = np.arange(0., 180., 10.)
+    np.testing.assert_allclose(trapezoid(thetas**2, thetas), np.sum(theta_weights(thetas) * thetas**2))
+    # Adjacent ranges share the weights of the full grid
+    low = theta_weights(thetas, theta_mask(thetas, [0., 90.]))
+    high = theta_weights(thetas, theta_mask(thetas, [90., 180.]))
+    np.testing.assert_allclose(np.sum(low) + np.sum(high), thetas[-1] - thetas[0])
+
+
+def test_fold_integrates_over_thetas(fledge):
+    flux = 1e-8 * fledge.egrid**-2.
+    counts = fledge.fold(flux, years=[2])
+    tables = fledge.dr.conversion_tables[2]
+    rates = np.einsum("e,ter->tr", flux * fledge.ewidths, tables) / 100
+    expected = trapezoid(rates, fledge.thetas, axis=0) * fledge.dr.livetimes[2]
+    np.testing.assert_allclose(counts[2], expected)
+
+
+def test_fold_ranges_add_up(fledge):
+    flux = 1e-8 * fledge.egrid**-2.
+    full = fledge.fold(flux)
+    low = fledge.fold(flux, theta_range=[0., 90.])
+    high = fledge.fold(flux, theta_range=[90., 180.])
+    for year in full.keys():
+        np.testing.assert_allclose(low[year] + high[year], full[year])
+
+
+def test_background(fledge, stored_userconfig):
+    background = Fledgeling(stored_userconfig, background=True)
+    background.wait()
+    assert background.ready
+    flux = 1e-8 * fledge.egrid**-2.
+    np.testing.assert_allclose(background.fold(flux)[3], fledge.fold(flux)[3])
+    np.testing.assert_allclose(background.atmos.binned["numu"], fledge.atmos.binned["numu"])
+
+
+def test_background_executor(stored_userconfig):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        background = Fledgeling(stored_userconfig, background=True, executor=executor)
+        # Used before waiting
+        assert len(background.dr.conversion_tables) == 10
+        background.wait()
+        assert background.ready
+        # The pool of the caller is not shut down
+        assert executor.submit(int).result() == 0
+
+
+def test_background_errors(userconfig, tmp_path):
+    background = Fledgeling(dict(
+        userconfig, **{"experimental data": {"filepath": str(tmp_path), "pre-computed": False}}
+    ), background=True)
+    with pytest.raises(FileNotFoundError):
+        background.wait()
+
+
+def test_create(stored_userconfig):
+    fledge = asyncio.run(Fledgeling.create(stored_userconfig))
+    assert fledge.ready
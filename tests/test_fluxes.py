@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Name: test_fluxes.py
+# Authors: Stephan Meighen-Berger
+# Tests of the flux model registry
+
+import numpy as np
+import pytest
+from fledgeling import fluxes
+from fledgeling.fluxes import broken_power_law, cutoff_power_law, power_law
+
+
+def test_models():
+    energies = np.array([1e4, 1e5, 1e6])
+    np.testing.assert_allclose(power_law(energies, norm=2., index=2., e0=1e5), [200., 2., 0.02])
+    broken = broken_power_law(energies, norm=1., index1=2., index2=3., ebreak=1e5, e0=1e4)
+    np.testing.assert_allclose(broken, [1., 1e-2, 1e-5])
+    np.testing.assert_allclose(
+        cutoff_power_law(energies, ecut=1e5), power_law(energies) * np.exp(-energies / 1e5)
+    )
+
+
+def test_broadcasting():
+    energies = np.logspace(2., 6., 5)
+    flux = power_law(energies, norm=[[1.], [2.]], index=[2., 2.5, 3.])
+    assert flux.shape == (2, 3, 5)
+    np.testing.assert_allclose(flux[1, 2], power_law(energies, norm=2., index=3.))
+
+
+def test_registry(fledge, monkeypatch):
+    monkeypatch.setattr(fluxes, "_registry", dict(fluxes._registry))
+
+    @fluxes.register("flat")
+    def flat(energies, norm=1.):
+        return fluxes._params(norm)[0] * np.ones_like(energies)
+
+    assert "flat" in fluxes.available_models()
+    assert "atmospheric numu" in fledge.fluxes.models
+    np.testing.assert_allclose(fledge.fluxes.evaluate("flat", norm=3.), 3.)
+
+
+def test_cache(fledge):
+    models = fledge.fluxes
+    first = models.evaluate("power law", index=[2., 2.5])
+    assert models.evaluate("power law", index=[2., 2.5]) is first
+    assert models.evaluate("power law", index=[2., 2.6]) is not first
+    assert not first.flags.writeable
+    models.clear()
+    assert models.evaluate("power law", index=[2., 2.5]) is not first
+
+
+def test_cache_size(fledge):
+    models = fledge.fluxes
+    models.clear()
+    size = fledge.config["advanced"]["flux cache size"]
+    for index in np.linspace(2., 3., size + 1):
+        models.evaluate("power law", index=index)
+    assert len(models._cache) == size
+
+
+def test_atmospheric(fledge):
+    flux = fledge.fluxes.evaluate("atmospheric nue", norm=[1., 2.])
+    assert flux.shape == (2, len(fledge.thetas), len(fledge.egrid))
+    np.testing.assert_allclose(flux[1] * fledge.ewidths, 2. * fledge.atmos.binned["nue"])
+    with pytest.raises(ValueError):
+        fledge.fluxes.evaluate("atmospheric nue", energies=[1e3])
+
+
+def test_unknown_model(fledge):
+    with pytest.raises(ValueError):
+        fledge.fluxes.evaluate("log parabola")
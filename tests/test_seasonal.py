@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Name: test_seasonal.py
+# Authors: Stephan Meighen-Berger
+# Tests of the seasonal atmospheric prediction
+
+import numpy as np
+import pytest
+from fledgeling import Fledgeling
+from fledgeling.data_reader import _monthly_uptime
+
+
+def test_monthly_uptime():
+    # 2021-01-31 12:00 to 2021-02-02 12:00 and 2021-12-31 12:00 to 2022-01-01 12:00
+    uptime = _monthly_uptime(np.array([[59245.5, 59247.5], [59579.5, 59580.5]])) / 86400.
+    expected = np.zeros(12)
+    expected[[0, 1, 11]] = [0.5 + 0.5, 1.5, 0.5]
+    np.testing.assert_allclose(uptime, expected)
+
+
+def test_months_sum_to_the_livetime(fledge):
+    for year, livetime in fledge.dr.livetimes.items():
+        monthly = fledge.dr.monthly_livetimes[year]
+        assert monthly.shape == (12,)
+        np.testing.assert_allclose(np.sum(monthly), livetime)
+
+
+@pytest.fixture(scope="module")
+def hkkm(stored_userconfig, hkkm_tables):
+    table, seasonal = hkkm_tables
+    return Fledgeling(dict(stored_userconfig, atmospherics={
+        "name": "hkkm", "hkkm model": {"table": table, "seasonal table": seasonal}
+    }))
+
+
+def test_seasonal_counts(hkkm):
+    seasonal = hkkm.seasonal(years=[3, 4], theta_range=[90., 180.])
+    assert seasonal.rates.shape == (2, 12, len(hkkm.egrid))
+    assert seasonal.counts(resolved=True).shape == (2, 12, len(hkkm.egrid))
+    yearly = hkkm.atmospheric_counts(years=[3, 4], theta_range=[90., 180.])
+    # The months are the yearly table scaled by 1 + month index / 10
+    scales = 1. + np.arange(12) / 10.
+    for i, year in enumerate(seasonal.years):
+        fractions = seasonal.livetimes[i] / np.sum(seasonal.livetimes[i])
+        np.testing.assert_allclose(
+            seasonal.counts()[i], yearly[year] * np.sum(fractions * scales), rtol=1e-5
+        )
+
+
+@pytest.mark.parametrize("atmospherics", [
+    {"name": "analytic"},
+    {"name": "hkkm", "hkkm model": {"seasonal table": None}},
+])
+def test_no_seasons(stored_userconfig, hkkm_tables, atmospherics):
+    atmospherics = dict(atmospherics, **{"hkkm model": dict(
+        atmospherics.get("hkkm model", {}), table=hkkm_tables[0]
+    )})
+    fledge = Fledgeling(dict(stored_userconfig, atmospherics=atmospherics))
+    with pytest.raises(ValueError):
+        fledge.seasonal()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Name: test_shared.py
+# Authors: Stephan Meighen-Berger
+# Tests of the tables shared between processes
+
+import os
+from multiprocessing import get_context
+import numpy as np
+import pytest
+from fledgeling import Fledgeling
+from fledgeling.shared import TableServer
+
+
+def _worker_counts(userconfig: dict, manifest: str) -> np.array:
+    """ Folds in a worker attached to the shared tables
+    """
+    fledge = Fledgeling(dict(userconfig, advanced=dict(
+        userconfig["advanced"], **{"shared tables": manifest}
+    )))
+    return fledge.fold(1e-8 * fledge.egrid**-2.)[3]
+
+
+@pytest.fixture
+def server(fledge, tmp_path):
+    with TableServer(fledge, str(tmp_path / "manifest.json")) as server:
+        yield server
+
+
+def test_attached_tables(fledge, userconfig, server):
+    attached = Fledgeling(dict(userconfig, advanced=dict(
+        userconfig["advanced"], **{"shared tables": server.manifest}
+    )))
+    flux = 1e-8 * fledge.egrid**-2.
+    expected = fledge.fold(flux)
+    for year, counts in attached.fold(flux).items():
+        np.testing.assert_allclose(counts, expected[year])
+    np.testing.assert_allclose(attached.atmos.binned["numu"], fledge.atmos.binned["numu"])
+    np.testing.assert_allclose(
+        attached.dr.monthly_livetimes[2], fledge.dr.monthly_livetimes[2]
+    )
+    np.testing.assert_array_equal(
+        attached.dr._event_dic.year(4)["E"], fledge.dr._event_dic.year(4)["E"]
+    )
+    table = attached.dr.conversion_tables[0]
+    assert not table.flags.writeable
+
+
+def test_worker_process(fledge, userconfig, server):
+    with get_context("spawn").Pool(1) as pool:
+        counts = pool.apply(_worker_counts, (userconfig, server.manifest))
+    expected = fledge.fold(1e-8 * fledge.egrid**-2.)[3]
+    np.testing.assert_allclose(counts, expected)
+    # The block outlives the worker
+    np.testing.assert_allclose(_worker_counts(userconfig, server.manifest), expected)
+
+
+def test_close_removes_the_manifest(fledge, tmp_path):
+    manifest = str(tmp_path / "closed.json")
+    server = TableServer(fledge, manifest)
+    assert os.path.isfile(manifest)
+    server.close()
+    assert not os.path.exists(manifest)
+
+
+def test_grid_mismatch(userconfig, server):
+    with pytest.raises(ValueError):
+        Fledgeling(dict(userconfig, advanced=dict(
+            userconfig["advanced"], **{"shared tables": server.manifest, "thetas": [0., 180., 5.]}
+        )))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Name: test_systematics.py
+# Authors: Stephan Meighen-Berger
+# Tests of the detector systematics response
+
+import numpy as np
+import pytest
+from fledgeling.systematics import energy_scale, resample, smearing_width
+
+_UNIGRID = np.linspace(2., 9., 71)
+
+
+def _gaussians():
+    """ Gaussian smearing around a few reconstructed energies
+    """
+    centers = np.array([4., 5., 6.5])[:, None]
+    return np.exp(-0.5 * ((_UNIGRID - centers) / 0.3)**2)
+
+
+def test_resample_identity_and_edges():
+    tables = _gaussians()
+    np.testing.assert_allclose(resample(tables, np.arange(len(_UNIGRID))), tables)
+    # Outside of the grid is zero
+    assert np.all(resample(tables, np.full(len(_UNIGRID), -1.)) == 0.)
+
+
+def test_energy_scale_shifts():
+    tables = _gaussians()
+    step = _UNIGRID[1] - _UNIGRID[0]
+    shifted = energy_scale(tables, _UNIGRID, 3 * step)
+    np.testing.assert_allclose(shifted[:, 3:], tables[:, :-3], atol=1e-12)
+    mean = np.sum(shifted * _UNIGRID, axis=-1) / np.sum(shifted, axis=-1)
+    np.testing.assert_allclose(mean, [4. + 3 * step, 5. + 3 * step, 6.5 + 3 * step])
+
+
+@pytest.mark.parametrize("width", [0.8, 1., 1.2])
+def test_smearing_width(width):
+    tables = _gaussians()
+    smeared = smearing_width(tables, _UNIGRID, width)
+    # The counts are conserved and the mean is kept
+    np.testing.assert_allclose(np.sum(smeared, axis=-1), np.sum(tables, axis=-1))
+    np.testing.assert_allclose(
+        np.sum(smeared * _UNIGRID, axis=-1) / np.sum(smeared, axis=-1), [4., 5., 6.5],
+        atol=1e-6
+    )
+    variance = np.sum(smeared * (_UNIGRID - 5.)**2, axis=-1)[1] / np.sum(smeared, axis=-1)[1]
+    np.testing.assert_allclose(np.sqrt(variance), 0.3 * width, rtol=0.02)
+
+
+@pytest.fixture(scope="module")
+def response(fledge):
+    return fledge.systematics(theta_range=[90., 180.])
+
+
+def test_nominal_matches_fold(fledge, response):
+    flux = 1e-8 * fledge.egrid**-2.
+    counts = response.expected_counts(flux)
+    folded = fledge.fold(flux, theta_range=[90., 180.])
+    for i, year in enumerate(response.years):
+        np.testing.assert_allclose(counts[i], folded[year], rtol=1e-10, atol=1e-12)
+
+
+def test_grid_points_match_fold(fledge, response):
+    flux = 1e-8 * fledge.egrid**-2.
+    unigrid = np.log10(fledge.egrid)
+    for name, morph, param in [
+            ("energy scale", energy_scale, "energy_scale"),
+            ("smearing width", smearing_width, "smearing_width")]:
+        value = response.grids[name][2]
+        tables = {
+            year: morph(fledge.dr.conversion_tables[year], unigrid, value)
+            for year in response.years
+        }
+        folded = fledge.fold(flux, theta_range=[90., 180.], tables=tables)
+        counts = response.expected_counts(flux, **{param: value})
+        np.testing.assert_allclose(counts[4], folded[4], rtol=1e-10, atol=1e-12)
+
+
+def test_broadcasting_and_clamping(fledge, response):
+    flux = 1e-8 * fledge.egrid**-2.
+    scales = np.linspace(-0.1, 0.1, 5)
+    counts = response.expected_counts(
+        np.array([flux, 2. * flux])[:, None], energy_scale=scales, aeff_scale=1.1
+    )
+    assert counts.shape == (2, 5, len(response.years), len(fledge.egrid))
+    np.testing.assert_allclose(counts[1], 2. * counts[0])
+    np.testing.assert_allclose(
+        counts[0, 2], 1.1 * response.expected_counts(flux, energy_scale=scales[2])
+    )
+    edge = response.grids["smearing width"][-1]
+    np.testing.assert_allclose(
+        response.expected_counts(flux, smearing_width=10.),
+        response.expected_counts(flux, smearing_width=edge)
+    )
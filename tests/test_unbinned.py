@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Name: test_unbinned.py
+# Authors: Stephan Meighen-Berger
+# Tests of the per-event PDFs
+
+import numpy as np
+import pytest
+from scipy.interpolate import RegularGridInterpolator
+from fledgeling.unbinned import _PDF_FLOOR, _cell
+
+
+def test_cell():
+    grid = np.array([0., 2., 4., 6.])
+    low, frac = _cell(np.array([-1., 0., 3., 6., 7.]), grid)
+    np.testing.assert_array_equal(low, [0, 0, 1, 2, 2])
+    np.testing.assert_allclose(frac, [0., 0., 0.5, 1., 1.])
+
+
+@pytest.fixture(scope="module")
+def unbinned(fledge):
+    return fledge.unbinned()
+
+
+def test_pdf_normalized(fledge, unbinned):
+    pdf = unbinned.pdf(fledge.fluxes.evaluate("power law"))
+    assert pdf.shape == (len(unbinned.years), len(fledge.thetas), len(fledge.egrid))
+    cell = (fledge.thetas[1] - fledge.thetas[0]) * np.diff(np.log10(fledge.egrid))[0]
+    np.testing.assert_allclose(np.sum(pdf, axis=(1, 2)) * cell, 1.)
+
+
+def test_event_pdf_interpolates(fledge, unbinned):
+    flux = fledge.fluxes.evaluate("power law", index=2.)
+    pdf = unbinned.pdf(flux)
+    values = unbinned.event_pdf(flux)
+    decs = fledge.thetas - 90.
+    log_egrid = np.log10(fledge.egrid)
+    expected = []
+    for i, year in enumerate(unbinned.years):
+        events = fledge.dr._event_dic.year(year)
+        interpolator = RegularGridInterpolator((decs, log_egrid), pdf[i])
+        expected.append(interpolator(np.column_stack([
+            np.clip(events["dec"], decs[0], decs[-1]),
+            np.clip(events["E"], log_egrid[0], log_egrid[-1]),
+        ])))
+    np.testing.assert_allclose(values, np.concatenate(expected))
+    assert len(values) == len(unbinned.event_years)
+
+
+def test_event_pdf_cached(fledge, unbinned):
+    flux = fledge.fluxes.evaluate("power law", index=2.2)
+    values = unbinned.event_pdf(flux)
+    assert unbinned.event_pdf(flux) is values
+    assert not values.flags.writeable
+    unbinned.clear()
+    assert unbinned.event_pdf(flux) is not values
+
+
+def test_log_likelihood(fledge, unbinned):
+    flux = fledge.fluxes.evaluate("power law")
+    n_signal = np.array([0., 10., 100.])
+    llh = unbinned.log_likelihood(n_signal, flux)
+    assert llh.shape == (3,)
+    np.testing.assert_allclose(llh[0], np.sum(np.log(unbinned.background)))
+    # Events outside of both PDFs are floored. Here all are signal without signal flux
+    n_events = len(unbinned.event_years)
+    llh = unbinned.log_likelihood(n_events, np.zeros_like(fledge.egrid))
+    np.testing.assert_allclose(llh, n_events * np.log(_PDF_FLOOR))
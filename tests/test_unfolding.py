@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Name: test_unfolding.py
+# Authors: Stephan Meighen-Berger
+# Tests of the spectrum unfolding
+
+import numpy as np
+import pytest
+from fledgeling.unfolding import Unfolding
+
+_EGRID = np.logspace(2., 6., 20)
+
+
+def _synthetic(years=2):
+    """ Unfolding with a known, well conditioned response. The effective area rises
+    as E^2.5 and each energy leaks a fifth of its counts into each neighbouring
+    reconstructed energy
+    """
+    smearing = 0.6 * np.eye(len(_EGRID)) + 0.2 * (
+        np.eye(len(_EGRID), k=1) + np.eye(len(_EGRID), k=-1)
+    )
+    unfolding = Unfolding.__new__(Unfolding)
+    unfolding._config = {"runtime": {"random state": np.random.RandomState(1337)}}
+    unfolding._egrid = _EGRID
+    response = 1e16 * (_EGRID[:, None] / 1e2)**2.5 * smearing
+    unfolding._response = np.broadcast_to(
+        response, (years, 1) + smearing.shape
+    ) * np.arange(1., years + 1.)[:, None, None, None]
+    unfolding._sensitivity = unfolding.adjoint(np.ones((years, 1, len(_EGRID))))
+    return unfolding
+
+
+def _true_flux():
+    return 1e-8 * _EGRID[None, :]**-2.5 * (1. + 0.5 * np.sin(np.log10(_EGRID)))[None, :]
+
+
+def test_richardson_lucy_recovers_the_spectrum():
+    unfolding = _synthetic()
+    counts = unfolding.forward(_true_flux())
+    flux = unfolding.richardson_lucy(counts, iterations=5000)
+    np.testing.assert_allclose(flux, _true_flux(), rtol=1e-2)
+
+
+def test_least_squares_recovers_the_spectrum():
+    unfolding = _synthetic()
+    counts = unfolding.forward(_true_flux())
+    flux = unfolding.least_squares(counts, regularization=1e-8, prior=_EGRID**-2.5)
+    np.testing.assert_allclose(flux, _true_flux(), rtol=1e-3)
+
+
+def test_batched_bootstrap():
+    unfolding = _synthetic()
+    counts = unfolding.forward(_true_flux())
+    result = unfolding.unfold(counts, bootstrap=4, iterations=10)
+    assert result["samples"].shape == (4, 1, len(_EGRID))
+    assert result["error"].shape == (1, len(_EGRID))
+    # Each sample is unfolded on its own
+    samples = np.random.RandomState(1337).poisson(counts, size=(4,) + counts.shape)
+    np.testing.assert_allclose(
+        result["samples"][1], unfolding.richardson_lucy(samples[1].astype(float), iterations=10)
+    )
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        _synthetic().unfold(np.ones((2, 1, len(_EGRID))), method="svd")
+
+
+def test_response_matches_fold(fledge):
+    unfolding = fledge.unfolding()
+    flux = 1e-8 * fledge.egrid**-2.
+    counts = unfolding.forward(flux[None, :])
+    folded = fledge.fold(flux)
+    for i, year in enumerate(unfolding.years):
+        np.testing.assert_allclose(counts[i, 0], folded[year])
+
+
+def test_bands_add_up(fledge):
+    full = fledge.unfolding().response
+    bands = fledge.unfolding(dec_bands=[-90., -30., 20., 90.]).response
+    np.testing.assert_allclose(np.sum(bands, axis=1), full[:, 0])
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Name: test_utils.py
+# Authors: Stephan Meighen-Berger
+# Tests of the columnar tables
+
+import numpy as np
+import pytest
+from fledgeling.utils import columnar_from2d
+
+
+def _tables():
+    """ Two keys with their own rows and one key sharing the rows of another
+    """
+    rng = np.random.default_rng(0)
+    first = np.column_stack([
+        np.repeat([2., 2.1, 2.2], 4), rng.uniform(0., 1., 12)
+    ])
+    second = np.column_stack([
+        np.repeat([2.1, 2.3], 3), rng.uniform(0., 1., 6)
+    ])
+    return {0: first, 1: second, 2: second}
+
+
+def test_round_trip():
+    dic = _tables()
+    table = columnar_from2d(dic, ["E", "value"], bin_columns=("E",))
+    assert table.keys() == [0, 1, 2]
+    for key, arr in dic.items():
+        view = table.year(key)
+        np.testing.assert_array_equal(view["E"], arr[:, 0])
+        np.testing.assert_allclose(view["value"], arr[:, 1], rtol=1e-6)
+    # The bin edges keep their full precision
+    assert table.edges["E"].dtype == np.float64
+    np.testing.assert_array_equal(table.edges["E"], [2., 2.1, 2.2, 2.3])
+
+
+def test_shared_rows_stored_once():
+    table = columnar_from2d(_tables(), ["E", "value"], bin_columns=("E",))
+    assert table.segments[1] == table.segments[2]
+    assert len(table) == 18
+
+
+def test_year_is_a_view():
+    table = columnar_from2d(_tables(), ["E", "value"])
+    assert np.shares_memory(table.year(1)["value"], table["value"])
+
+
+def test_select():
+    dic = _tables()
+    table = columnar_from2d(dic, ["E", "value"], bin_columns=("E",))
+    selection = table.select(table["value"] > 0.5)
+    for key, arr in dic.items():
+        kept = arr[arr[:, 1] > 0.5]
+        np.testing.assert_array_equal(selection.year(key)["E"], kept[:, 0])
+
+
+def test_dtypes():
+    table = columnar_from2d(
+        _tables(), ["E", "value"], bin_columns=("E",), dtypes={"value": np.float64}
+    )
+    assert table.codes("E").dtype == np.uint8
+    assert table["value"].dtype == np.float64
+
+
+@pytest.mark.parametrize("n_edges, dtype", [
+    (256, np.uint8), (257, np.uint16), (65536, np.uint16), (65537, np.uint32)
+])
+def test_codes_fit_the_edges(n_edges, dtype):
+    values = np.arange(n_edges, dtype=float)
+    table = columnar_from2d(
+        {0: np.column_stack([values, values])}, ["E", "value"], bin_columns=("E",)
+    )
+    assert table.codes("E").dtype == dtype
+    np.testing.assert_array_equal(table["E"], values)
+
+
+def test_read_only():
+    table = columnar_from2d(_tables(), ["E", "value"], bin_columns=("E",))
+    table.set_read_only()
+    with pytest.raises(ValueError):
+        table.codes("value")[0] = 1.
+
+
+def test_to_dataframe():
+    table = columnar_from2d(_tables(), ["E", "value"], bin_columns=("E",))
+    df = table.to_dataframe()
+    assert list(df.columns) == ["E", "value", "year"]
+    assert len(df) == 24